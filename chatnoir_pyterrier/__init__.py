@@ -5,7 +5,9 @@ __version__ = version("chatnoir-pyterrier")
 
 from logging import getLogger
 
-from chatnoir_pyterrier import retrieve, feature
+from chatnoir_pyterrier import (
+    retrieve, feature, cache, cassette, checkpoint, hedge, lookup, ratelimit, rerank, session, stats, text,
+)
 import chatnoir_api as api
 
 logger = getLogger("chatnoir-pyterrier")
@@ -13,6 +15,21 @@ logger = getLogger("chatnoir-pyterrier")
 # Re-export from child modules.
 Feature = feature.Feature
 ChatNoirRetrieve = retrieve.ChatNoirRetrieve
+ChatNoirText = text.ChatNoirText
+ChatNoirFeatures = rerank.ChatNoirFeatures
+ChatNoirLookup = lookup.ChatNoirLookup
+DocumentContentCache = cache.DocumentContentCache
+ResultCache = cache.ResultCache
+Cassette = cassette.Cassette
+Checkpoint = checkpoint.Checkpoint
+RateLimiter = ratelimit.RateLimiter
+HedgingPolicy = hedge.HedgingPolicy
+ChatNoirSession = session.ChatNoirSession
+RetrievalStats = stats.RetrievalStats
+StatsHook = stats.StatsHook
+LoggingStatsHook = stats.LoggingStatsHook
+PrometheusStatsHook = stats.PrometheusStatsHook
+OpenTelemetryStatsHook = stats.OpenTelemetryStatsHook
 
 # Re-export from `chatnoir-api`.
 Index: TypeAlias = api.Index
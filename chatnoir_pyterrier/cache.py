@@ -0,0 +1,456 @@
+from collections import OrderedDict
+from os import getpid
+from pathlib import Path
+from pickle import dumps, loads  # nosec: B403
+from sqlite3 import Connection, connect
+from threading import local, Lock
+from time import time_ns, time
+from typing import Optional, Union, Any, Dict, List, Tuple, Sequence, NamedTuple, Iterable
+from uuid import UUID
+from zlib import compress, decompress
+
+from chatnoir_api import Index, Result, ExplainedResult
+
+
+# Access times are only used to evict least recently used entries, so they are
+# written in batches instead of taking the write lock on every read.
+_ACCESS_BATCH_SIZE = 1000
+_ACCESS_BATCH_SECONDS = 10.0
+
+
+class _SqliteStore:
+    _path: Path
+    _compression_level: int
+    _max_size: Optional[int]
+    _timeout: float
+    _read_only: bool
+    _local: local
+    _accessed: Dict[str, int]
+    _accessed_lock: Lock
+    _accessed_flushed: float
+
+    def __init__(
+        self,
+        path: Path,
+        compression_level: int,
+        max_size: Optional[int],
+        timeout: float,
+        read_only: bool = False,
+    ):
+        if not 0 <= compression_level <= 9:
+            raise ValueError("Compression level must be between 0 and 9.")
+        if max_size is not None and max_size <= 0:
+            raise ValueError("Maximum size must be positive.")
+        self._path = path
+        self._compression_level = compression_level
+        self._max_size = max_size
+        self._timeout = timeout
+        self._read_only = read_only
+        self._local = local()
+        self._accessed = {}
+        self._accessed_lock = Lock()
+        self._accessed_flushed = time()
+
+    @property
+    def _connection(self) -> Connection:
+        # SQLite connections must neither be shared between threads
+        # nor survive a fork, so open one per thread and process.
+        pid = getpid()
+        if getattr(self._local, "pid", None) != pid and self._read_only:
+            # Never write to read-only stores, not even the schema, so that they can be read from read-only mounts.
+            self._local.connection = connect(
+                f"{self._path.absolute().as_uri()}?mode=ro",
+                timeout=self._timeout,
+                isolation_level=None,
+                uri=True,
+            )
+            self._local.pid = pid
+        elif getattr(self._local, "pid", None) != pid:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            connection = connect(
+                self._path,
+                timeout=self._timeout,
+                isolation_level=None,
+            )
+            # Write-ahead logging lets readers and a writer work concurrently,
+            # also across processes sharing the same file.
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._create_tables(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    @staticmethod
+    def _create_tables(connection: Connection) -> None:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, "
+            "value BLOB NOT NULL, "
+            "compressed INTEGER NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "accessed INTEGER NOT NULL)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed "
+            "ON entries (accessed)"
+        )
+        # Keep the total size in a single row, so that writes need not sum up all entries.
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS total ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "size INTEGER NOT NULL)"
+        )
+        connection.execute(
+            "INSERT OR IGNORE INTO total (id, size) "
+            "SELECT 0, COALESCE(SUM(size), 0) FROM entries"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+            "BEGIN UPDATE total SET size = size + NEW.size; END"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries "
+            "BEGIN UPDATE total SET size = size - OLD.size + NEW.size; END"
+        )
+        connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+            "BEGIN UPDATE total SET size = size - OLD.size; END"
+        )
+
+    def _touch(self, keys: Iterable[str]) -> None:
+        # Access times only matter for eviction.
+        if self._max_size is None or self._read_only:
+            return
+        accessed = time_ns()
+        with self._accessed_lock:
+            for key in keys:
+                self._accessed[key] = accessed
+            if len(self._accessed) < _ACCESS_BATCH_SIZE and \
+                    time() - self._accessed_flushed < _ACCESS_BATCH_SECONDS:
+                return
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._flush_accessed(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _flush_accessed(self, connection: Connection) -> None:
+        with self._accessed_lock:
+            accessed = self._accessed
+            self._accessed = {}
+            self._accessed_flushed = time()
+        connection.executemany(
+            "UPDATE entries SET accessed = ? WHERE key = ?",
+            [(accessed_time, key) for key, accessed_time in accessed.items()],
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._connection.execute(
+            "SELECT value, compressed FROM entries WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        value, compressed = row
+        self._touch((key,))
+        return decompress(value) if compressed else value
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        # Read in batches, as SQLite limits the number of query parameters.
+        values: Dict[str, bytes] = {}
+        connection = self._connection
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            query = f"SELECT key, value, compressed FROM entries WHERE key IN ({placeholders})"  # nosec: B608
+            rows = connection.execute(query, batch).fetchall()
+            for key, value, compressed in rows:
+                values[key] = decompress(value) if compressed else value
+        self._touch(values.keys())
+        return values
+
+    def set(self, key: str, value: bytes) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Sequence[Tuple[str, bytes]]) -> None:
+        # Write all items in one transaction, which is much faster than one transaction each.
+        if len(items) == 0:
+            return
+        compressed = self._compression_level > 0
+        accessed = time_ns()
+        rows = []
+        for key, value in items:
+            stored = compress(value, self._compression_level) if compressed else value
+            rows.append((key, stored, int(compressed), len(stored), accessed))
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO entries "
+                "(key, value, compressed, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "value = excluded.value, "
+                "compressed = excluded.compressed, "
+                "size = excluded.size, "
+                "accessed = excluded.accessed",
+                rows,
+            )
+            if self._max_size is not None:
+                self._flush_accessed(connection)
+                self._evict(connection, self._max_size)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _total_size(connection: Connection) -> int:
+        return connection.execute("SELECT size FROM total").fetchone()[0]
+
+    @classmethod
+    def _evict(cls, connection: Connection, max_size: int) -> None:
+        total_size = cls._total_size(connection)
+        if total_size <= max_size:
+            return
+        # Evict least recently used entries until the cache fits again.
+        evicted: List[Tuple[str]] = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM entries ORDER BY accessed ASC"
+        ):
+            if total_size <= max_size:
+                break
+            evicted.append((key,))
+            total_size -= size
+        connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        self._connection.execute("DELETE FROM entries")
+
+    def size(self) -> int:
+        return self._total_size(self._connection)
+
+    def __len__(self) -> int:
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM entries"
+        ).fetchone()[0]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Connections and locks cannot be pickled, e.g., when sending to Ray workers.
+        state = self.__dict__.copy()
+        del state["_local"]
+        del state["_accessed_lock"]
+        state["_accessed"] = {}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._local = local()
+        self._accessed_lock = Lock()
+
+
+# Query-independent attributes of search results, which can be looked up later without a query.
+METADATA_ATTRIBUTES = (
+    "trec_id", "warc_id", "crawl_date", "target_hostname", "target_uri", "cache_uri",
+    "page_rank", "spam_rank", "title_text", "content_type", "language",
+)
+
+
+def _metadata(result: Union[Result, ExplainedResult]) -> Dict[str, Any]:
+    return {
+        attribute: result.title.text if attribute == "title_text" else getattr(result, attribute)
+        for attribute in METADATA_ATTRIBUTES
+    }
+
+
+class DocumentContentCache:
+    path: Path
+    store_metadata: bool
+    _store: _SqliteStore
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        compression_level: int = 6,
+        max_size: Optional[int] = None,
+        timeout: float = 60,
+        store_metadata: bool = False,
+    ):
+        self.path = Path(path)
+        self.store_metadata = store_metadata
+        self._store = _SqliteStore(
+            path=self.path / "contents.sqlite3",
+            compression_level=compression_level,
+            max_size=max_size,
+            timeout=timeout,
+        )
+
+    @staticmethod
+    def _key(index: Index, docno: str, plain: bool) -> str:
+        return f"{index}\t{docno}\t{'plain' if plain else 'html'}"
+
+    def get(self, index: Index, docno: str, plain: bool) -> Optional[str]:
+        value = self._store.get(self._key(index, docno, plain))
+        if value is None:
+            return None
+        return value.decode("utf-8")
+
+    def set(self, index: Index, docno: str, plain: bool, contents: str) -> None:
+        self._store.set(
+            self._key(index, docno, plain),
+            contents.encode("utf-8"),
+        )
+
+    @staticmethod
+    def _metadata_key(index: Index, uuid: UUID) -> str:
+        return f"{index}\t{uuid}\tmetadata"
+
+    def get_metadata(self, index: Index, uuid: UUID) -> Optional[Dict[str, Any]]:
+        return self.get_many_metadata([(index, uuid)])[0]
+
+    def get_many_metadata(self, documents: Sequence[Tuple[Index, UUID]]) -> List[Optional[Dict[str, Any]]]:
+        keys = [self._metadata_key(index, uuid) for index, uuid in documents]
+        values = self._store.get_many(keys)
+        return [
+            loads(values[key]) if key in values else None  # nosec: B301
+            for key in keys
+        ]
+
+    def set_metadata(self, results: Iterable[Union[Result, ExplainedResult]]) -> None:
+        self._store.set_many([
+            (self._metadata_key(result.index, result.uuid), dumps(_metadata(result)))
+            for result in results
+        ])
+
+    def clear(self) -> None:
+        self._store.clear()
+
+    def size(self) -> int:
+        return self._store.size()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __repr__(self) -> str:
+        return f"DocumentContentCache({str(self.path)!r})"
+
+
+class _ResultCacheEntry(NamedTuple):
+    created: float
+    num_results: Optional[int]
+    results: Sequence[Union[Result, ExplainedResult]]
+
+
+class ResultCache:
+    path: Optional[Path]
+    max_entries: int
+    ttl: Optional[float]
+    _entries: "OrderedDict[str, _ResultCacheEntry]"
+    _lock: Lock
+    _store: Optional[_SqliteStore]
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_entries: int = 10_000,
+        ttl: Optional[float] = None,
+        compression_level: int = 6,
+        max_size: Optional[int] = None,
+        timeout: float = 60,
+    ):
+        if max_entries < 0:
+            raise ValueError("Maximum number of entries must not be negative.")
+        self.path = Path(path) if path is not None else None
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._store = _SqliteStore(
+            path=self.path / "results.sqlite3",
+            compression_level=compression_level,
+            max_size=max_size,
+            timeout=timeout,
+        ) if self.path is not None else None
+
+    def _is_valid(self, entry: _ResultCacheEntry, num_results: Optional[int]) -> bool:
+        if self.ttl is not None and time() - entry.created > self.ttl:
+            return False
+        if entry.num_results is None:
+            return True
+        if num_results is not None and num_results <= entry.num_results:
+            return True
+        # The cached results are complete if fewer results than requested were found.
+        return len(entry.results) < entry.num_results
+
+    def _remember(self, key: str, entry: _ResultCacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(
+        self,
+        key: str,
+        num_results: Optional[int],
+    ) -> Optional[Sequence[Union[Result, ExplainedResult]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self._store is not None:
+            value = self._store.get(key)
+            if value is not None:
+                entry = _ResultCacheEntry(*loads(value))  # nosec: B301
+                self._remember(key, entry)
+        if entry is None or not self._is_valid(entry, num_results):
+            return None
+        if num_results is None:
+            return entry.results
+        # Serve shallower requests from deeper cached results.
+        return entry.results[:num_results]
+
+    def set(
+        self,
+        key: str,
+        num_results: Optional[int],
+        results: Sequence[Union[Result, ExplainedResult]],
+    ) -> None:
+        entry = _ResultCacheEntry(time(), num_results, list(results))
+        self._remember(key, entry)
+        if self._store is not None:
+            self._store.set(key, dumps(tuple(entry)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self._store is not None:
+            self._store.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Locks cannot be pickled, e.g., when sending to Ray workers.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        path = str(self.path) if self.path is not None else None
+        return f"ResultCache({path!r})"
@@ -0,0 +1,98 @@
+from hashlib import sha256
+from json import loads, dumps
+from pathlib import Path
+from typing import Optional, Union, Mapping, Any, Literal
+
+from chatnoir_pyterrier.cache import _SqliteStore
+
+CassetteMode = Literal["record", "replay", "record_missing"]
+
+
+class CassetteMissError(RuntimeError):
+    pass
+
+
+class Cassette:
+    path: Path
+    mode: CassetteMode
+    _store_path: Path
+    _store: _SqliteStore
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        mode: CassetteMode = "record_missing",
+        compression_level: int = 6,
+        timeout: float = 60,
+    ):
+        if mode not in ("record", "replay", "record_missing"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self._store_path = self.path / "responses.sqlite3"
+        self._store = _SqliteStore(
+            path=self._store_path,
+            compression_level=compression_level,
+            max_size=None,
+            timeout=timeout,
+            read_only=mode == "replay",
+        )
+
+    @staticmethod
+    def key(
+        method: str,
+        path: str,
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+    ) -> str:
+        body: Any = None
+        if data is not None:
+            body = loads(data)
+            if isinstance(body, dict):
+                # Never store the API key, and recordings should work with any key.
+                body.pop("apikey", None)
+                # Sets of indices are serialized in arbitrary order.
+                if isinstance(body.get("index"), list):
+                    body["index"] = sorted(body["index"])
+        request = dumps(
+            [
+                method,
+                path,
+                sorted(params.items()) if params is not None else None,
+                body,
+            ],
+            sort_keys=True,
+        )
+        return sha256(request.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str, description: str) -> Optional[str]:
+        if self.mode == "record":
+            return None
+        # Replaying from a cassette that was never recorded misses every request.
+        response = self._store.get(key) if self.mode != "replay" or self._store_path.exists() else None
+        if response is None:
+            if self.mode == "replay":
+                raise CassetteMissError(
+                    f"No recorded response for request: {description}. "
+                    f"Record missing responses with mode='record_missing'."
+                )
+            return None
+        return response.decode("utf-8")
+
+    def record(self, key: str, response: str) -> None:
+        if self.mode == "replay":
+            return
+        self._store.set(key, response.encode("utf-8"))
+
+    def clear(self) -> None:
+        if self.mode == "replay":
+            raise RuntimeError("Cannot clear a cassette in replay mode.")
+        self._store.clear()
+
+    def __len__(self) -> int:
+        if self.mode == "replay" and not self._store_path.exists():
+            return 0
+        return len(self._store)
+
+    def __repr__(self) -> str:
+        return f"Cassette({str(self.path)!r}, mode={self.mode!r})"
@@ -0,0 +1,50 @@
+from pathlib import Path
+from pickle import dumps, loads  # nosec: B403
+from typing import Optional, Union
+
+from pandas import DataFrame
+
+from chatnoir_pyterrier.cache import _SqliteStore
+
+
+class Checkpoint:
+    path: Path
+    chunk_size: int
+    _store: _SqliteStore
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        chunk_size: int = 100,
+        compression_level: int = 6,
+        timeout: float = 60,
+    ):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive.")
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self._store = _SqliteStore(
+            path=self.path / "results.sqlite3",
+            compression_level=compression_level,
+            max_size=None,
+            timeout=timeout,
+        )
+
+    def get(self, key: str) -> Optional[DataFrame]:
+        value = self._store.get(key)
+        if value is None:
+            return None
+        return loads(value)  # nosec: B301
+
+    def set(self, key: str, results: DataFrame) -> None:
+        # Each query's results are committed separately, so that finished queries survive a crash.
+        self._store.set(key, dumps(results))
+
+    def clear(self) -> None:
+        self._store.clear()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __repr__(self) -> str:
+        return f"Checkpoint({str(self.path)!r}, chunk_size={self.chunk_size!r})"
@@ -0,0 +1,63 @@
+from dataclasses import replace
+from typing import Literal, Sequence, Union, List, Dict, Tuple
+from uuid import UUID
+
+from chatnoir_api import Index, Result, ExplainedResult
+
+FusionMethod = Literal["score", "rrf", "combsum"]
+
+_ResultKey = Tuple[Index, UUID]
+
+
+def _fuse_scores(
+    rankings: Sequence[Sequence[Union[Result, ExplainedResult]]],
+    method: FusionMethod,
+    rrf_k: int,
+) -> Tuple[Dict[_ResultKey, float], Dict[_ResultKey, Union[Result, ExplainedResult]]]:
+    scores: Dict[_ResultKey, float] = {}
+    results: Dict[_ResultKey, Union[Result, ExplainedResult]] = {}
+    for ranking in rankings:
+        if len(ranking) == 0:
+            continue
+        min_score = min(result.score for result in ranking)
+        max_score = max(result.score for result in ranking)
+        for rank, result in enumerate(ranking, start=1):
+            score: float
+            if method == "score":
+                score = result.score
+            elif method == "rrf":
+                score = 1 / (rrf_k + rank)
+            elif method == "combsum":
+                # Normalize each ranking's scores to [0, 1], as scores of different indices are not comparable.
+                if max_score > min_score:
+                    score = (result.score - min_score) / (max_score - min_score)
+                else:
+                    score = 1.0
+            else:
+                raise ValueError(f"Unknown fusion method: {method}")
+            key = (result.index, result.uuid)
+            if key not in results:
+                results[key] = result
+                scores[key] = score
+            elif method == "score":
+                scores[key] = max(scores[key], score)
+            else:
+                scores[key] += score
+    return scores, results
+
+
+def fuse(
+    rankings: Sequence[Sequence[Union[Result, ExplainedResult]]],
+    method: FusionMethod = "score",
+    rrf_k: int = 60,
+) -> List[Union[Result, ExplainedResult]]:
+    scores, results = _fuse_scores(rankings, method, rrf_k)
+    # Sort by fused score, keeping the rankings' order for ties.
+    keys = sorted(scores.keys(), key=lambda key: -scores[key])
+    if method == "score":
+        return [results[key] for key in keys]
+    # Results from the API are dataclasses, so replace the score with the fused score.
+    return [
+        replace(results[key], score=scores[key])  # type: ignore[type-var]
+        for key in keys
+    ]
@@ -0,0 +1,126 @@
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock
+from typing import Optional, Dict, Deque, Any
+
+from numpy import percentile as numpy_percentile
+
+
+@dataclass(frozen=True)
+class HedgingStats:
+    requests: int
+    fired: int
+    won: int
+
+    @property
+    def won_ratio(self) -> float:
+        if self.fired == 0:
+            return 0.0
+        return self.won / self.fired
+
+
+class HedgingPolicy:
+    percentile: float
+    window: int
+    min_samples: int
+    budget: float
+    min_delay_seconds: float
+    max_workers: int
+
+    _lock: Lock
+    _latencies: Dict[str, Deque[float]]
+    _requests: int
+    _fired: int
+    _won: int
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        window: int = 1000,
+        min_samples: int = 20,
+        budget: float = 0.05,
+        min_delay_seconds: float = 0.0,
+        max_workers: int = 64,
+    ):
+        if not 0 < percentile < 100:
+            raise ValueError("Percentile must be between 0 and 100.")
+        if window < 1:
+            raise ValueError("Window must be positive.")
+        if min_samples < 1:
+            raise ValueError("Minimum samples must be positive.")
+        if not 0 <= budget <= 1:
+            raise ValueError("Budget must be between 0 and 1.")
+        if min_delay_seconds < 0:
+            raise ValueError("Minimum delay must not be negative.")
+        if max_workers < 1:
+            raise ValueError("Maximum workers must be positive.")
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.budget = budget
+        self.min_delay_seconds = min_delay_seconds
+        # Threads for sending hedged requests, sized independently of the connection pool.
+        self.max_workers = max_workers
+
+        self._lock = Lock()
+        self._latencies = {}
+        self._requests = 0
+        self._fired = 0
+        self._won = 0
+
+    def delay(self, kind: str) -> Optional[float]:
+        # Hedge requests that take longer than most recent requests of the same kind,
+        # but only once enough latencies are known.
+        with self._lock:
+            self._requests += 1
+            latencies = list(self._latencies.get(kind, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return max(self.min_delay_seconds, float(numpy_percentile(latencies, self.percentile)))
+
+    def record(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            latencies = self._latencies.get(kind)
+            if latencies is None:
+                latencies = self._latencies[kind] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def can_fire(self) -> bool:
+        # Limit the extra load to a fraction of all requests.
+        with self._lock:
+            return self._fired + 1 <= self.budget * self._requests
+
+    def fire(self) -> bool:
+        with self._lock:
+            if self._fired + 1 > self.budget * self._requests:
+                return False
+            self._fired += 1
+            return True
+
+    def won(self) -> None:
+        with self._lock:
+            self._won += 1
+
+    def stats(self) -> HedgingStats:
+        with self._lock:
+            return HedgingStats(
+                requests=self._requests,
+                fired=self._fired,
+                won=self._won,
+            )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Locks cannot be pickled, e.g., when sending to Ray workers.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        return (
+            f"HedgingPolicy(percentile={self.percentile!r}, "
+            f"budget={self.budget!r})"
+        )
@@ -0,0 +1,180 @@
+from gzip import open as open_gzip
+from pathlib import Path
+from typing import Iterable, Optional, Union, Any, IO, Iterator, List, TYPE_CHECKING
+
+from pandas import DataFrame
+from pyterrier.io import write_results as write_trec_results
+from typing_extensions import Literal, TypeAlias
+
+if TYPE_CHECKING:
+    from pyarrow import Table, Schema
+
+ResultsFormat: TypeAlias = Literal["trec", "jsonl", "parquet"]
+
+
+def _infer_format(path: Path) -> ResultsFormat:
+    suffixes = path.suffixes
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes = suffixes[:-1]
+    suffix = suffixes[-1] if suffixes else ""
+    if suffix == ".parquet":
+        return "parquet"
+    elif suffix in (".jsonl", ".json"):
+        return "jsonl"
+    else:
+        return "trec"
+
+
+def _serializable_value(value: Any) -> Any:
+    if value is None:
+        return None
+    elif hasattr(value, "to_json"):
+        # Explanations are JSON-serializable dataclasses.
+        return value.to_json()
+    else:
+        return str(value)
+
+
+def _serializable(results: DataFrame) -> DataFrame:
+    # UUIDs and explanations cannot be written as is.
+    return results.assign(**{
+        column: results[column].map(_serializable_value)
+        for column in ("uuid", "explanation")
+        if column in results.columns
+    })
+
+
+def _write_trec(results: Iterable[DataFrame], path: Path, run_name: str) -> None:
+    append = False
+    for chunk in results:
+        if len(chunk) == 0:
+            continue
+        write_trec_results(
+            chunk,
+            str(path),
+            format="trec",
+            append=append,
+            run_name=run_name,
+        )
+        append = True
+    if not append:
+        path.write_text("")
+
+
+def _write_jsonl(results: Iterable[DataFrame], path: Path) -> None:
+    file: IO[str]
+    if path.suffix == ".gz":
+        file = open_gzip(path, "wt", encoding="utf-8")
+    else:
+        file = path.open("wt", encoding="utf-8")
+    with file:
+        for chunk in results:
+            if len(chunk) == 0:
+                continue
+            _serializable(chunk).to_json(
+                file,
+                orient="records",
+                lines=True,
+                date_format="iso",
+                force_ascii=False,
+            )
+
+
+def _arrow_tables(results: Iterable[DataFrame]) -> Iterator["Table"]:
+    try:
+        from pyarrow import Table, DictionaryType, dictionary, int32, schema as arrow_schema
+    except ImportError:
+        raise ImportError(
+            "Converting results to Arrow requires pyarrow. "
+            "Install it with: pip install chatnoir-pyterrier[arrow]"
+        )
+
+    schema: Optional[Schema] = None
+    for chunk in results:
+        if len(chunk) == 0:
+            continue
+        # Use the first chunk's schema for all subsequent chunks.
+        table = Table.from_pandas(
+            _serializable(chunk),
+            schema=schema,
+            preserve_index=False,
+        )
+        if schema is None:
+            # Categorical columns of later chunks might have more categories than fit the first chunk's indices.
+            schema = arrow_schema(
+                [
+                    field.with_type(dictionary(int32(), field.type.value_type))
+                    if isinstance(field.type, DictionaryType) else field
+                    for field in table.schema
+                ],
+                metadata=table.schema.metadata,
+            )
+            table = table.cast(schema)
+        yield table
+
+
+def to_arrow(results: Iterable[DataFrame]) -> "Table":
+    try:
+        from pyarrow import Table, concat_tables
+    except ImportError:
+        raise ImportError(
+            "Converting results to Arrow requires pyarrow. "
+            "Install it with: pip install chatnoir-pyterrier[arrow]"
+        )
+
+    chunks: List[DataFrame] = []
+
+    def remember_last(results: Iterable[DataFrame]) -> Iterator[DataFrame]:
+        for chunk in results:
+            chunks[:] = [chunk]
+            yield chunk
+
+    tables = list(_arrow_tables(remember_last(results)))
+    if len(tables) == 0:
+        # Keep the columns even if there are no results at all.
+        return Table.from_pandas(
+            _serializable(chunks[0] if len(chunks) > 0 else DataFrame()),
+            preserve_index=False,
+        )
+    return concat_tables(tables)
+
+
+def _write_parquet(results: Iterable[DataFrame], path: Path) -> None:
+    try:
+        from pyarrow.parquet import ParquetWriter
+    except ImportError:
+        raise ImportError(
+            "Writing Parquet files requires pyarrow. "
+            "Install it with: pip install chatnoir-pyterrier[arrow]"
+        )
+
+    writer: Optional[ParquetWriter] = None
+    try:
+        for table in _arrow_tables(results):
+            if writer is None:
+                writer = ParquetWriter(str(path), table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_results(
+    results: Iterable[DataFrame],
+    path: Union[str, Path],
+    format: Optional[ResultsFormat] = None,
+    run_name: str = "ChatNoir",
+) -> None:
+    path = Path(path)
+    if format is None:
+        format = _infer_format(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if format == "trec":
+        _write_trec(results, path, run_name)
+    elif format == "jsonl":
+        _write_jsonl(results, path)
+    elif format == "parquet":
+        _write_parquet(results, path)
+    else:
+        raise ValueError(f"Unknown results format: {format}")
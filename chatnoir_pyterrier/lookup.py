@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Optional, Any, Dict, List, Iterable, Sequence
+
+from pandas import DataFrame, concat
+from tqdm import tqdm
+
+from chatnoir_pyterrier.feature import Feature
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, _ContentsKey
+from chatnoir_pyterrier.session import _run_blocking
+from chatnoir_pyterrier.text import ChatNoirText, _Document
+
+_logger = getLogger("chatnoir-pyterrier")
+
+# Features that ChatNoir only returns for a query, and thus cannot be looked up.
+_QUERY_DEPENDENT_FEATURES = (
+    Feature.TITLE_HIGHLIGHTED | Feature.SNIPPET_HIGHLIGHTED | Feature.SNIPPET_TEXT | Feature.EXPLANATION
+)
+
+# Metadata columns (named like the metadata attributes) and their features.
+_METADATA_COLUMNS = (
+    ("trec_id", Feature.TREC_ID),
+    ("warc_id", Feature.WARC_ID),
+    ("crawl_date", Feature.CRAWL_DATE),
+    ("target_hostname", Feature.TARGET_HOSTNAME),
+    ("target_uri", Feature.TARGET_URI),
+    ("cache_uri", Feature.CACHE_URI),
+    ("page_rank", Feature.PAGE_RANK),
+    ("spam_rank", Feature.SPAM_RANK),
+    ("title_text", Feature.TITLE_TEXT),
+    ("content_type", Feature.CONTENT_TYPE),
+    ("language", Feature.LANGUAGE),
+)
+
+
+@dataclass
+class ChatNoirLookup(ChatNoirText):
+    name = "ChatNoirLookup"
+
+    features: Feature = Feature.NONE
+    strict: bool = False
+
+    def __post_init__(self):
+        query_dependent = self.features & _QUERY_DEPENDENT_FEATURES
+        if query_dependent != Feature.NONE:
+            raise ValueError(f"Cannot look up query-dependent features: {query_dependent}")
+
+    def _metadata_features(self) -> List[str]:
+        return [column for column, feature in _METADATA_COLUMNS if feature in self.features]
+
+    def _metadata(
+        self,
+        fetcher: ChatNoirRetrieve,
+        documents: List[Optional[_Document]],
+    ) -> List[Optional[Dict[str, Any]]]:
+        if len(self._metadata_features()) == 0:
+            return [None] * len(documents)
+        if fetcher.content_cache is None or not fetcher.content_cache.store_metadata:
+            raise RuntimeError(
+                "Looking up metadata requires a content cache that stores the metadata of searched documents "
+                "(with store_metadata=True)."
+            )
+        known = [(document[1], document[0]) for document in documents if document is not None]
+        found = iter(fetcher.content_cache.get_many_metadata(known))
+        metadata = [next(found) if document is not None else None for document in documents]
+        misses = sum(1 for document, values in zip(documents, metadata) if document is not None and values is None)
+        fetcher.stats.count("metadata_hits", len(known) - misses)
+        fetcher.stats.count("metadata_misses", misses)
+        if misses > 0:
+            message = (
+                f"No metadata stored for {misses} of {len(known)} documents. "
+                f"Metadata is only available for documents searched with a content cache "
+                f"that has store_metadata=True."
+            )
+            if self.strict:
+                raise RuntimeError(message)
+            _logger.warning(f"{message} Their metadata columns are None.")
+        return metadata
+
+    def _add_columns(
+        self,
+        inp: DataFrame,
+        documents: List[Optional[_Document]],
+        metadata: List[Optional[Dict[str, Any]]],
+        contents: Dict[_ContentsKey, Optional[str]],
+    ) -> DataFrame:
+        columns: Dict[str, List[Any]] = {}
+        if Feature.UUID in self.features:
+            columns["uuid"] = [document[0] if document is not None else None for document in documents]
+        if Feature.INDEX in self.features:
+            columns["index"] = [document[1] if document is not None else None for document in documents]
+        for column in self._metadata_features():
+            columns[column] = [values[column] if values is not None else None for values in metadata]
+        return self._add_contents(inp.assign(**columns), documents, contents)
+
+    def _lookup(self, fetcher: ChatNoirRetrieve, inp: DataFrame) -> DataFrame:
+        documents = self._documents(inp)
+        metadata = self._metadata(fetcher, documents)
+        contents = fetcher._fetch_contents_by_key(
+            self._contents_keys(documents),
+            verbose=fetcher.verbose,
+        )
+        return fetcher._compact_results(self._add_columns(inp, documents, metadata, contents))
+
+    def transform(self, inp: DataFrame) -> DataFrame:
+        fetcher = self._fetcher()
+        with fetcher.stats.time("lookup"):
+            result = self._lookup(fetcher, inp)
+        fetcher.stats.finish()
+        return result
+
+    async def atransform(self, inp: DataFrame) -> DataFrame:
+        fetcher = self._fetcher()
+        with fetcher.stats.time("lookup"):
+            documents = self._documents(inp)
+            metadata = await _run_blocking(self._metadata, fetcher, documents)
+            contents = await fetcher._afetch_contents_by_key(
+                self._contents_keys(documents),
+                verbose=fetcher.verbose,
+            )
+            result = fetcher._compact_results(self._add_columns(inp, documents, metadata, contents))
+        fetcher.stats.finish()
+        return result
+
+    def lookup(self, docnos: Iterable[str], chunk_size: int = 10_000) -> DataFrame:
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive.")
+        docnos = docnos if isinstance(docnos, Sequence) else list(docnos)
+        fetcher = self._fetcher()
+        results: List[DataFrame] = []
+        with fetcher.stats.time("lookup"), tqdm(
+            desc="Looking up documents in ChatNoir",
+            unit="document",
+            total=len(docnos),
+            disable=not fetcher.verbose,
+        ) as progress:
+            for start in range(0, len(docnos), chunk_size):
+                # Look up in chunks, so that only one chunk's intermediate data is held at once.
+                chunk = docnos[start:start + chunk_size]
+                results.append(self._lookup(fetcher, DataFrame({"docno": chunk})))
+                progress.update(len(chunk))
+            if len(results) == 0:
+                results.append(self._lookup(fetcher, DataFrame({"docno": []})))
+            result = fetcher._compact_results(concat(results, ignore_index=True))
+        fetcher.stats.finish()
+        return result
@@ -0,0 +1,298 @@
+from hashlib import sha256
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from json import loads, dumps
+from random import Random
+from threading import Thread, Lock
+from time import sleep
+from typing import Optional, Any, Dict, List, Sequence
+from urllib.parse import urlsplit, parse_qs
+from uuid import UUID, uuid5, NAMESPACE_URL
+
+from chatnoir_api.model import parse_index, index_prefix
+
+from chatnoir_pyterrier.hedge import HedgingPolicy
+from chatnoir_pyterrier.session import ChatNoirSession
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, like the real API.
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, so do not wait for delayed ACKs.
+    disable_nagle_algorithm = True
+    server: "_MockHTTPServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _respond(self, status_code: int, body: str, content_type: str) -> None:
+        data = body.encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _fail(self) -> bool:
+        mock = self.server.mock
+        latency_seconds = mock._latency_seconds()
+        if latency_seconds > 0:
+            sleep(latency_seconds)
+        if not mock._should_fail():
+            return False
+        mock._count("errors")
+        self._respond(mock.error_status_code, "Mock error.", "text/plain")
+        return True
+
+    def do_POST(self) -> None:
+        mock = self.server.mock
+        path = urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if path not in ("/api/v1/_search", "/api/v1/_phrases"):
+            self._respond(404, "Not found.", "text/plain")
+            return
+        phrases = path == "/api/v1/_phrases"
+        mock._count("phrase_searches" if phrases else "searches")
+        if self._fail():
+            return
+        request: Dict[str, Any] = loads(body)
+        if not request.get("apikey"):
+            self._respond(401, "Missing API key.", "text/plain")
+            return
+        response = mock._search_response(
+            query=request["query"],
+            indices=sorted(request["index"]),
+            start=request.get("from") or 0,
+            size=request.get("size") or 10,
+            explain=request.get("explain", False),
+            phrases=phrases,
+            search_method=request.get("search_method", "default"),
+        )
+        self._respond(200, dumps(response), "application/json")
+
+    def do_GET(self) -> None:
+        mock = self.server.mock
+        split = urlsplit(self.path)
+        if split.path != "/cache":
+            self._respond(404, "Not found.", "text/plain")
+            return
+        mock._count("contents")
+        if self._fail():
+            return
+        params = parse_qs(split.query)
+        uuid = params["uuid"][0]
+        plain = params.get("plain", ["false"])[0] == "true"
+        self._respond(
+            200,
+            mock._contents(uuid, plain),
+            "text/plain" if plain else "text/html",
+        )
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Accept many concurrent connections, e.g., from sharded worker processes.
+    request_queue_size = 128
+    mock: "MockChatNoirServer"
+
+
+class MockChatNoirServer:
+    total_results: int
+    max_page_size: int
+    latency_seconds: float
+    slow_rate: float
+    slow_latency_seconds: float
+    error_rate: float
+    error_status_code: int
+    unknown_rate: float
+    document_size: int
+    requests: Dict[str, int]
+
+    _server: Optional[_MockHTTPServer]
+    _thread: Optional[Thread]
+    _random: Random
+    _lock: Lock
+
+    def __init__(
+        self,
+        total_results: int = 1000,
+        max_page_size: int = 1000,
+        latency_seconds: float = 0,
+        slow_rate: float = 0,
+        slow_latency_seconds: float = 1,
+        error_rate: float = 0,
+        error_status_code: int = 503,
+        unknown_rate: float = 0.1,
+        document_size: int = 10_000,
+        seed: int = 0,
+    ):
+        if not 0 <= slow_rate <= 1:
+            raise ValueError("Slow rate must be between 0 and 1.")
+        if not 0 <= error_rate <= 1:
+            raise ValueError("Error rate must be between 0 and 1.")
+        if not 0 <= unknown_rate <= 1:
+            raise ValueError("Unknown rate must be between 0 and 1.")
+        self.total_results = total_results
+        self.max_page_size = max_page_size
+        self.latency_seconds = latency_seconds
+        self.slow_rate = slow_rate
+        self.slow_latency_seconds = slow_latency_seconds
+        self.error_rate = error_rate
+        self.error_status_code = error_status_code
+        self.unknown_rate = unknown_rate
+        self.document_size = document_size
+        self.requests = {}
+        self._server = None
+        self._thread = None
+        self._random = Random(seed)  # nosec: B311
+        self._lock = Lock()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def _latency_seconds(self) -> float:
+        # Some requests are much slower than the others, like the tail latency of the real API.
+        if self.slow_rate == 0:
+            return self.latency_seconds
+        with self._lock:
+            slow = self._random.random() < self.slow_rate
+        return self.slow_latency_seconds if slow else self.latency_seconds
+
+    def _should_fail(self) -> bool:
+        if self.error_rate == 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    @staticmethod
+    def _digest(*parts: Any) -> bytes:
+        return sha256("\t".join(str(part) for part in parts).encode("utf-8")).digest()
+
+    def _result(
+        self,
+        query: str,
+        index: str,
+        rank: int,
+        explain: bool,
+        phrases: bool,
+    ) -> Dict[str, Any]:
+        # Derive all fields from the query terms and rank, so that results are reproducible.
+        # Like ChatNoir's analyzers, ignore whitespace and case.
+        terms = " ".join(query.casefold().split())
+        document = self._digest(terms, index, rank, phrases)[:6].hex()
+        # Derive the document's fields from the document only, so that they are the same for all queries.
+        digest = self._digest(index, document)
+        prefix = index_prefix(parse_index(index))
+        known = int.from_bytes(digest[16:20], "big") / 2 ** 32 >= self.unknown_rate
+        trec_id = f"{prefix}-{document}" if known else None
+        # Like ChatNoir, derive the UUID from the TREC ID.
+        uuid = uuid5(NAMESPACE_URL, f"{prefix}:{trec_id}") if trec_id is not None \
+            else UUID(bytes=digest[:16], version=5)
+        hostname = f"example-{digest[20] % 50}.com"
+        score = 1000.0 / (rank + 1)
+        result: Dict[str, Any] = {
+            "score": score,
+            "uuid": str(uuid),
+            "index": index,
+            "trec_id": trec_id,
+            "target_hostname": hostname,
+            "target_uri": f"https://{hostname}/{digest[27:31].hex()}",
+            "page_rank": digest[31] / 10,
+            "spam_rank": digest[30] % 100,
+            "title": f"<em>{query}</em> result {rank + 1}",
+            "snippet": f"A snippet about <em>{query}</em> for result {rank + 1}.",
+            "warc_id": f"<urn:uuid:{uuid}>",
+            "cache_uri": f"https://chatnoir.eu/cache?uuid={uuid}&index={index}",
+            "crawl_date": "2022-01-01T00:00:00",
+            "content_type": "text/html",
+            "lang": "en",
+        }
+        if explain:
+            result["explanation"] = {
+                "value": score,
+                "description": f"mock score for {query}",
+                "details": [],
+            }
+        return result
+
+    def _search_response(
+        self,
+        query: str,
+        indices: Sequence[str],
+        start: int,
+        size: int,
+        explain: bool,
+        phrases: bool,
+        search_method: str,
+    ) -> Dict[str, Any]:
+        end = min(start + min(size, self.max_page_size), self.total_results)
+        results: List[Dict[str, Any]] = [
+            self._result(query, indices[rank % len(indices)], rank, explain, phrases)
+            for rank in range(start, end)
+        ]
+        return {
+            "meta": {
+                "indices": list(indices),
+                "query_time": int(self.latency_seconds * 1000),
+                "total_results": self.total_results,
+                "search_method": search_method,
+            },
+            "results": results,
+        }
+
+    def _contents(self, uuid: str, plain: bool) -> str:
+        text = f"Document {uuid}. "
+        filler = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+        text += filler * max(0, (self.document_size - len(text)) // len(filler))
+        if plain:
+            return text
+        return f"<html><head><title>{uuid}</title></head><body><p>{text}</p></body></html>"
+
+    @property
+    def url(self) -> str:
+        if self._server is None:
+            raise RuntimeError("Mock server is not running.")
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    def session(
+        self,
+        pool_size: int = 10,
+        timeout: float = 60,
+        hedging: Optional[HedgingPolicy] = None,
+    ) -> ChatNoirSession:
+        return ChatNoirSession(base_url=self.url, pool_size=pool_size, timeout=timeout, hedging=hedging)
+
+    def start(self) -> "MockChatNoirServer":
+        if self._server is not None:
+            raise RuntimeError("Mock server is already running.")
+        server = _MockHTTPServer(("127.0.0.1", 0), _MockHandler)
+        server.mock = self
+        self._server = server
+        self._thread = Thread(
+            target=server.serve_forever,
+            name="chatnoir-mock",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+
+    def __enter__(self) -> "MockChatNoirServer":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def __repr__(self) -> str:
+        return (
+            f"MockChatNoirServer(total_results={self.total_results!r}, "
+            f"latency_seconds={self.latency_seconds!r}, "
+            f"error_rate={self.error_rate!r})"
+        )
@@ -0,0 +1,279 @@
+import os
+from asyncio import sleep as async_sleep
+from contextlib import contextmanager, asynccontextmanager
+from dataclasses import dataclass
+from logging import getLogger
+from threading import Lock, BoundedSemaphore
+from time import monotonic, sleep
+from typing import Optional, Iterator, AsyncIterator, Dict, Set, Tuple
+
+from requests import HTTPError
+
+_logger = getLogger("chatnoir-pyterrier")
+
+
+@dataclass(frozen=True)
+class RateLimiterStats:
+    requests: int
+    throttled: int
+    requests_per_second: Optional[float]
+    total_wait_seconds: float
+    max_wait_seconds: float
+
+    @property
+    def mean_wait_seconds(self) -> float:
+        if self.requests == 0:
+            return 0.0
+        return self.total_wait_seconds / self.requests
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    if isinstance(error, HTTPError):
+        return error.response.status_code if error.response is not None else None
+    # E.g., ChatNoirHTTPError, which cannot be imported here without a cycle.
+    status_code = getattr(error, "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    # The ChatNoir API answers with 429 when the quota is exceeded,
+    # and with 5xx when it is overloaded.
+    status_code = _status_code(error)
+    return status_code is not None and (status_code == 429 or 500 <= status_code < 600)
+
+
+class RateLimiter:
+    max_requests_per_second: Optional[float]
+    min_requests_per_second: Optional[float]
+    max_concurrency: Optional[int]
+    decrease_factor: float
+    increase_ratio: float
+    burst: int
+
+    _lock: Lock
+    _semaphore: Optional[BoundedSemaphore]
+    _requests_per_second: Optional[float]
+    _tokens: float
+    _updated: float
+    _requests: int
+    _throttled: int
+    _total_wait_seconds: float
+    _max_wait_seconds: float
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        min_requests_per_second: Optional[float] = None,
+        decrease_factor: float = 0.5,
+        increase_ratio: float = 0.01,
+        burst: int = 1,
+    ):
+        if requests_per_second is not None and requests_per_second <= 0:
+            raise ValueError("Requests per second must be positive.")
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("Maximum concurrency must be positive.")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("Decrease factor must be between 0 and 1.")
+        if burst < 1:
+            raise ValueError("Burst must be positive.")
+        if min_requests_per_second is None and requests_per_second is not None:
+            min_requests_per_second = requests_per_second / 100
+        self.max_requests_per_second = requests_per_second
+        self.min_requests_per_second = min_requests_per_second
+        self.max_concurrency = max_concurrency
+        self.decrease_factor = decrease_factor
+        self.increase_ratio = increase_ratio
+        self.burst = burst
+
+        self._lock = Lock()
+        self._semaphore = BoundedSemaphore(max_concurrency) \
+            if max_concurrency is not None else None
+        self._requests_per_second = requests_per_second
+        self._tokens = burst
+        self._updated = monotonic()
+        self._requests = 0
+        self._throttled = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def _reserve(self) -> float:
+        # Take a token from the bucket and return how long to wait for it.
+        with self._lock:
+            if self._requests_per_second is None:
+                return 0.0
+            now = monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated) * self._requests_per_second,
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._requests_per_second
+
+    def _succeeded(self) -> None:
+        # Additively increase the rate again after successful requests.
+        with self._lock:
+            if self._requests_per_second is None or self.max_requests_per_second is None:
+                return
+            self._requests_per_second = min(
+                self.max_requests_per_second,
+                self._requests_per_second + self.max_requests_per_second * self.increase_ratio,
+            )
+
+    def _throttle(self) -> None:
+        # Multiplicatively decrease the rate when the API is overloaded.
+        with self._lock:
+            self._throttled += 1
+            if self._requests_per_second is None or self.min_requests_per_second is None:
+                return
+            self._requests_per_second = max(
+                self.min_requests_per_second,
+                self._requests_per_second * self.decrease_factor,
+            )
+
+    def _waited(self, waited_seconds: float) -> None:
+        with self._lock:
+            self._requests += 1
+            self._total_wait_seconds += waited_seconds
+            self._max_wait_seconds = max(self._max_wait_seconds, waited_seconds)
+
+    @contextmanager
+    def _limit(self, start: float) -> Iterator[None]:
+        # Wait for a token, given that a concurrency slot was already acquired.
+        try:
+            wait_seconds = self._reserve()
+            if wait_seconds > 0:
+                sleep(wait_seconds)
+            self._waited(monotonic() - start)
+            try:
+                yield
+            except BaseException as error:
+                if is_throttling_error(error):
+                    self._throttle()
+                raise
+            self._succeeded()
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    @asynccontextmanager
+    async def _alimit(self, start: float) -> AsyncIterator[None]:
+        try:
+            wait_seconds = self._reserve()
+            if wait_seconds > 0:
+                await async_sleep(wait_seconds)
+            self._waited(monotonic() - start)
+            try:
+                yield
+            except BaseException as error:
+                if is_throttling_error(error):
+                    self._throttle()
+                raise
+            self._succeeded()
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    @contextmanager
+    def request(self) -> Iterator[None]:
+        start = monotonic()
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+        with self._limit(start):
+            yield
+
+    @asynccontextmanager
+    async def arequest(self) -> AsyncIterator[None]:
+        start = monotonic()
+        if self._semaphore is not None:
+            # The semaphore is shared with threads, so poll instead of blocking the event loop.
+            while not self._semaphore.acquire(blocking=False):
+                await async_sleep(0.005)
+        async with self._alimit(start):
+            yield
+
+    @contextmanager
+    def try_request(self) -> Iterator[bool]:
+        # Like request(), but only if a concurrency slot is free right now, e.g., for optional duplicate requests.
+        start = monotonic()
+        if self._semaphore is not None and not self._semaphore.acquire(blocking=False):
+            yield False
+            return
+        with self._limit(start):
+            yield True
+
+    @asynccontextmanager
+    async def atry_request(self) -> AsyncIterator[bool]:
+        start = monotonic()
+        if self._semaphore is not None and not self._semaphore.acquire(blocking=False):
+            yield False
+            return
+        async with self._alimit(start):
+            yield True
+
+    @property
+    def requests_per_second(self) -> Optional[float]:
+        return self._requests_per_second
+
+    def stats(self) -> RateLimiterStats:
+        with self._lock:
+            return RateLimiterStats(
+                requests=self._requests,
+                throttled=self._throttled,
+                requests_per_second=self._requests_per_second,
+                total_wait_seconds=self._total_wait_seconds,
+                max_wait_seconds=self._max_wait_seconds,
+            )
+
+    def __repr__(self) -> str:
+        return (
+            f"RateLimiter(requests_per_second={self.max_requests_per_second!r}, "
+            f"max_concurrency={self.max_concurrency!r})"
+        )
+
+
+_shared_rate_limiters: Dict[str, RateLimiter] = {}
+_shared_rate_limiters_lock = Lock()
+_ignored_rate_limits: Set[Tuple[str, Optional[float], Optional[int]]] = set()
+
+
+def shared_rate_limiter(
+    api_key: str,
+    requests_per_second: Optional[float] = None,
+    max_concurrency: Optional[int] = None,
+) -> RateLimiter:
+    # All transformers in this process with the same API key share one limiter.
+    with _shared_rate_limiters_lock:
+        rate_limiter = _shared_rate_limiters.get(api_key)
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(
+                requests_per_second=requests_per_second,
+                max_concurrency=max_concurrency,
+            )
+            _shared_rate_limiters[api_key] = rate_limiter
+        elif (
+            rate_limiter.max_requests_per_second != requests_per_second or
+            rate_limiter.max_concurrency != max_concurrency
+        ) and (api_key, requests_per_second, max_concurrency) not in _ignored_rate_limits:
+            _ignored_rate_limits.add((api_key, requests_per_second, max_concurrency))
+            _logger.warning(
+                f"Ignoring rate limits (requests_per_second={requests_per_second}, "
+                f"max_concurrency={max_concurrency}) because another rate limiter "
+                f"already exists for this API key: {rate_limiter}"
+            )
+        return rate_limiter
+
+
+def _reset_shared_rate_limiters() -> None:
+    # Locks might be held by other threads while forking, so start over in the child.
+    global _shared_rate_limiters_lock
+    _shared_rate_limiters_lock = Lock()
+    _shared_rate_limiters.clear()
+    _ignored_rate_limits.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_shared_rate_limiters)
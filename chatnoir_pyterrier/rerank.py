@@ -0,0 +1,202 @@
+from dataclasses import dataclass, field, replace
+from math import inf
+from typing import Optional, Any, Dict, List, Tuple, Union, Sequence, Set
+
+from chatnoir_api import Result, ExplainedResult
+from pandas import DataFrame, isna
+from pyterrier import Transformer
+from pyterrier.model import add_ranks
+
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve
+from chatnoir_pyterrier.session import _run_blocking
+from chatnoir_pyterrier.stats import RetrievalStats, NULL_STATS
+
+# Candidates of one query: the topic row and the candidates' document numbers.
+_Candidates = Tuple[Dict[str, Any], Sequence[Any]]
+
+
+class _CandidatesFound:
+    # Tells whether all candidates are among the results found so far.
+    _remaining: Set[Any]
+    _checked: int
+
+    def __init__(self, docnos: Sequence[Any]):
+        self._remaining = {docno for docno in docnos if not isna(docno)}
+        self._checked = 0
+
+    def __call__(self, results: Sequence[Union[Result, ExplainedResult]]) -> bool:
+        # Results only ever grow, so only check the new results.
+        for result in results[self._checked:]:
+            self._remaining.discard(result.trec_id)
+        self._checked = len(results)
+        return self.all_found
+
+    @property
+    def all_found(self) -> bool:
+        return len(self._remaining) == 0
+
+
+@dataclass
+class ChatNoirFeatures(Transformer):
+    name = "ChatNoirFeatures"
+
+    retrieve: ChatNoirRetrieve = field(default_factory=ChatNoirRetrieve)
+    max_results: int = 1000
+    stats: RetrievalStats = field(
+        default_factory=lambda: NULL_STATS,
+        init=False,
+        repr=False,
+        compare=False,
+    )
+
+    def __post_init__(self):
+        if self.max_results < 1:
+            raise ValueError("Maximum results must be positive.")
+
+    def _fetcher(self) -> ChatNoirRetrieve:
+        # Search only as deep as allowed, and collect separate statistics.
+        fetcher = replace(self.retrieve, num_results=self.max_results, fan_out=False)
+        fetcher._start_stats()
+        self.stats = fetcher.stats
+        return fetcher
+
+    @staticmethod
+    def _candidates(inp: DataFrame) -> List[_Candidates]:
+        if not {"qid", "query", "docno"}.issubset(inp.columns):
+            raise RuntimeError("Needs qid, query, and docno columns.")
+        return [
+            (
+                {"qid": qid, "query": candidates["query"].iloc[0]},
+                candidates["docno"].tolist(),
+            )
+            for qid, candidates in inp.groupby("qid", sort=False, observed=True)
+        ]
+
+    def _search(
+        self,
+        fetcher: ChatNoirRetrieve,
+        candidates: _Candidates,
+    ) -> List[Union[Result, ExplainedResult]]:
+        row, docnos = candidates
+        explain = fetcher._feature_plan.explain
+        cache_key, cached_results = fetcher._cached_results(row["query"], explain)
+        if cached_results is not None:
+            fetcher.pages_fetched[row["qid"]] = 0
+            return cached_results
+        found = _CandidatesFound(docnos)
+        with fetcher.stats.time("search"):
+            results, pages = fetcher._search_results(row["query"], explain, stop=found)
+        fetcher._searched(row, results, pages)
+        if fetcher.result_cache is not None and cache_key is not None:
+            # When stopped early, the results are only complete up to the last found result.
+            fetcher.result_cache.set(cache_key, len(results) if found.all_found else self.max_results, results)
+        return results
+
+    async def _asearch(
+        self,
+        fetcher: ChatNoirRetrieve,
+        candidates: _Candidates,
+    ) -> List[Union[Result, ExplainedResult]]:
+        row, docnos = candidates
+        explain = fetcher._feature_plan.explain
+        cache_key, cached_results = await _run_blocking(fetcher._cached_results, row["query"], explain) \
+            if fetcher.result_cache is not None else (None, None)
+        if cached_results is not None:
+            fetcher.pages_fetched[row["qid"]] = 0
+            return cached_results
+        found = _CandidatesFound(docnos)
+        with fetcher.stats.time("search"):
+            results, pages = await fetcher._asearch_results(row["query"], explain, stop=found)
+        await fetcher._asearched(row, results, pages)
+        if fetcher.result_cache is not None and cache_key is not None:
+            await _run_blocking(
+                fetcher.result_cache.set,
+                cache_key,
+                len(results) if found.all_found else self.max_results,
+                results,
+            )
+        return results
+
+    @staticmethod
+    def _matches(
+        candidates: Sequence[_Candidates],
+        searched: Sequence[List[Union[Result, ExplainedResult]]],
+    ) -> List[Optional[Union[Result, ExplainedResult]]]:
+        matches: List[Optional[Union[Result, ExplainedResult]]] = []
+        for (_, docnos), results in zip(candidates, searched):
+            results_by_docno = {}
+            for result in reversed(results):
+                # Keep the highest ranked result of each document, but never match unknown TREC IDs.
+                if result.trec_id is not None:
+                    results_by_docno[result.trec_id] = result
+            matches.extend(
+                results_by_docno.get(docno) if not isna(docno) else None
+                for docno in docnos
+            )
+        return matches
+
+    def _merge(
+        self,
+        fetcher: ChatNoirRetrieve,
+        inp: DataFrame,
+        candidates: Sequence[_Candidates],
+        matches: List[Optional[Union[Result, ExplainedResult]]],
+        contents: Dict[Any, Optional[str]],
+    ) -> DataFrame:
+        # Restore the candidates' order, as they were grouped by query.
+        qids = [row["qid"] for row, _ in candidates]
+        result = inp.iloc[inp["qid"].map({qid: i for i, qid in enumerate(qids)}).argsort(kind="stable")]
+        found = [(i, match) for i, match in enumerate(matches) if match is not None]
+        columns: Dict[str, Any] = {}
+        for column, values in fetcher._feature_plan.extract([match for _, match in found], contents).items():
+            if column == "docno":
+                continue
+            columns[column] = [None] * len(matches)
+            for (i, _), value in zip(found, values):
+                columns[column][i] = value
+        # Candidates that ChatNoir did not find within the maximum depth are ranked last.
+        columns["score"] = [score if score is not None else -inf for score in columns["score"]]
+        result = result.assign(**columns).reset_index(drop=True)
+        return fetcher._compact_results(add_ranks(result))
+
+    def transform(self, inp: DataFrame) -> DataFrame:
+        fetcher = self._fetcher()
+        with fetcher.stats.time("transform"):
+            candidates = self._candidates(inp)
+            searched = fetcher._map(
+                lambda query_candidates: self._search(fetcher, query_candidates),
+                candidates,
+                max_workers=fetcher.max_workers,
+                verbose=fetcher.verbose,
+                desc="Searching with ChatNoir",
+                unit="query",
+            )
+            matches = self._matches(candidates, searched)
+            contents = fetcher._fetch_contents(
+                (match for match in matches if match is not None),
+                verbose=fetcher.verbose,
+            )
+            result = self._merge(fetcher, inp, candidates, matches, contents)
+        fetcher.stats.finish()
+        return result
+
+    async def atransform(self, inp: DataFrame) -> DataFrame:
+        fetcher = self._fetcher()
+        with fetcher.stats.time("transform"):
+            candidates = self._candidates(inp)
+            searched = await fetcher._agather(
+                lambda query_candidates: self._asearch(fetcher, query_candidates),
+                candidates,
+                max_workers=fetcher.max_workers,
+                verbose=fetcher.verbose,
+                desc="Searching with ChatNoir",
+                unit="query",
+            )
+            matches = self._matches(candidates, searched)
+            contents = await fetcher._afetch_contents(
+                (match for match in matches if match is not None),
+                verbose=fetcher.verbose,
+            )
+            result = self._merge(fetcher, inp, candidates, matches, contents)
+        fetcher.stats.finish()
+        return result
@@ -1,23 +1,190 @@
-from dataclasses import dataclass, field
+from asyncio import Semaphore, Task, ensure_future, gather, get_running_loop
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field, replace
 from functools import reduce
-from itertools import islice
-from typing import Set, Optional, Iterable, Union, Any, Dict
+from hashlib import sha256
+from importlib.util import find_spec
+from json import dumps
+from operator import attrgetter
+from pathlib import Path
+from typing import (
+    Set, Optional, Iterable, Union, Any, Dict, List, Tuple, Callable, Sequence, TypeVar, Iterator, Deque,
+    Awaitable, Mapping, TYPE_CHECKING
+)
+from uuid import UUID
 
-from chatnoir_api import Index, Result, Slop, ExplainedResult
+from chatnoir_api import Index, Result, Slop, ExplainedResult, Results, Meta
 from chatnoir_api.model import SearchMethod
-from chatnoir_api.v1 import (
-    search, search_phrases
-)
 from chatnoir_api.defaults import (
     DEFAULT_INDEX, DEFAULT_SLOP, DEFAULT_RETRIES, DEFAULT_BACKOFF_SECONDS, DEFAULT_API_KEY, DEFAULT_SEARCH_METHOD
 )
-from pandas import DataFrame
-from pandas.core.groupby import DataFrameGroupBy
+from pandas import DataFrame, concat
 from pyterrier import Transformer
-from pyterrier.model import add_ranks
+from numpy import arange, array, cumsum, int64, float32
+from pyterrier.model import FIRST_RANK
 from tqdm import tqdm
 
+from chatnoir_pyterrier.cache import DocumentContentCache, ResultCache
+from chatnoir_pyterrier.cassette import Cassette, CassetteMissError
+from chatnoir_pyterrier.checkpoint import Checkpoint
 from chatnoir_pyterrier.feature import Feature
+from chatnoir_pyterrier.fusion import FusionMethod, fuse
+from chatnoir_pyterrier.io import ResultsFormat, write_results, to_arrow
+from chatnoir_pyterrier.ratelimit import RateLimiter, shared_rate_limiter
+from chatnoir_pyterrier.session import ChatNoirSession, default_session, _run_blocking
+from chatnoir_pyterrier.shard import ShardBackend, _split_shards, _run_shards
+from chatnoir_pyterrier.stats import RetrievalStats, StatsHook, NULL_STATS
+
+if TYPE_CHECKING:
+    from pyarrow import Table
+
+_T = TypeVar("_T")
+_U = TypeVar("_U")
+
+# Key of a cached document's contents: UUID, index, and whether to fetch plain text.
+_ContentsKey = Tuple[UUID, Index, bool]
+
+def _explanation(result: Union[Result, ExplainedResult]) -> Any:
+    if not isinstance(result, ExplainedResult):
+        raise RuntimeError(f"Unexpected response type: {type(result)}, expected: {type(ExplainedResult)}")
+    return result.explanation
+
+
+# Result columns of each feature, in column order, with the function to get the value from a result.
+# The functions are module-level or attribute getters, so that the transformer stays picklable.
+_FEATURE_COLUMNS: Tuple[Tuple[Feature, str, Callable[[Union[Result, ExplainedResult]], Any]], ...] = (
+    (Feature.UUID, "uuid", attrgetter("uuid")),
+    (Feature.TREC_ID, "trec_id", attrgetter("trec_id")),
+    (Feature.WARC_ID, "warc_id", attrgetter("warc_id")),
+    (Feature.INDEX, "index", attrgetter("index")),
+    (Feature.CRAWL_DATE, "crawl_date", attrgetter("crawl_date")),
+    (Feature.TARGET_HOSTNAME, "target_hostname", attrgetter("target_hostname")),
+    (Feature.TARGET_URI, "target_uri", attrgetter("target_uri")),
+    (Feature.CACHE_URI, "cache_uri", attrgetter("cache_uri")),
+    (Feature.PAGE_RANK, "page_rank", attrgetter("page_rank")),
+    (Feature.SPAM_RANK, "spam_rank", attrgetter("spam_rank")),
+    (Feature.TITLE_HIGHLIGHTED, "title_highlighted", attrgetter("title.html")),
+    (Feature.TITLE_TEXT, "title_text", attrgetter("title.text")),
+    (Feature.SNIPPET_HIGHLIGHTED, "snippet_highlighted", attrgetter("snippet.html")),
+    (Feature.SNIPPET_TEXT, "snippet_text", attrgetter("snippet.text")),
+    (Feature.EXPLANATION, "explanation", _explanation),
+)
+
+# Result columns of the contents features, and whether they contain plain text.
+_CONTENTS_COLUMNS = (
+    (Feature.CONTENTS, "contents", False),
+    (Feature.CONTENTS_PLAIN, "text", True),
+    (Feature.CONTENTS_PLAIN, "contents_plain", True),
+)
+
+# Result columns after the contents.
+_TRAILING_FEATURE_COLUMNS: Tuple[Tuple[Feature, str, Callable[[Union[Result, ExplainedResult]], Any]], ...] = (
+    (Feature.CONTENT_TYPE, "content_type", attrgetter("content_type")),
+    (Feature.LANGUAGE, "language", attrgetter("language")),
+)
+
+
+def _combine_features(features: Union[Feature, Set[Feature]]) -> Feature:
+    if isinstance(features, Set):
+        return reduce(
+            lambda feature_a, feature_b: feature_a | feature_b,
+            features,
+            Feature.NONE,
+        )
+    return features
+
+
+@dataclass(frozen=True)
+class _FeaturePlan:
+    # Result columns and how to extract them, compiled once from the features.
+    source: Union[Feature, Set[Feature]]
+    features: Feature
+    fan_out: bool
+    columns: Tuple[str, ...]
+    getters: Tuple[Tuple[str, Callable[[Union[Result, ExplainedResult]], Any]], ...]
+    contents_columns: Tuple[Tuple[str, bool], ...]
+    explain: bool
+    fetch_contents: bool
+    fetch_contents_plain: bool
+
+    @staticmethod
+    def compile(source: Union[Feature, Set[Feature]], fan_out: bool) -> "_FeaturePlan":
+        features = _combine_features(source)
+        getters: List[Tuple[str, Callable[[Union[Result, ExplainedResult]], Any]]] = [
+            ("docno", attrgetter("trec_id")),
+            ("score", attrgetter("score")),
+        ]
+        columns = ["docno", "score"]
+        for feature, column, get in _FEATURE_COLUMNS:
+            # When fanning out, always tell from which index each result came.
+            if feature in features or (feature == Feature.INDEX and fan_out):
+                getters.append((column, get))
+                columns.append(column)
+        contents_columns: List[Tuple[str, bool]] = []
+        for feature, column, plain in _CONTENTS_COLUMNS:
+            if feature in features:
+                contents_columns.append((column, plain))
+                columns.append(column)
+        for feature, column, get in _TRAILING_FEATURE_COLUMNS:
+            if feature in features:
+                getters.append((column, get))
+                columns.append(column)
+        return _FeaturePlan(
+            source=source,
+            features=features,
+            fan_out=fan_out,
+            columns=tuple(columns),
+            getters=tuple(getters),
+            contents_columns=tuple(contents_columns),
+            explain=Feature.EXPLANATION in features,
+            fetch_contents=Feature.CONTENTS in features,
+            fetch_contents_plain=Feature.CONTENTS_PLAIN in features,
+        )
+
+    def extract(
+        self,
+        results: Sequence[Union[Result, ExplainedResult]],
+        contents: Dict[_ContentsKey, Optional[str]],
+    ) -> Dict[str, List[Any]]:
+        values: Dict[str, List[Any]] = {
+            column: list(map(get, results))
+            for column, get in self.getters
+        }
+        contents_values: Dict[bool, List[Optional[str]]] = {}
+        for column, plain in self.contents_columns:
+            # The text and plain contents columns share the same values.
+            if plain not in contents_values:
+                contents_values[plain] = [
+                    contents.get((result.uuid, result.index, plain))
+                    for result in results
+                ]
+            values[column] = contents_values[plain]
+        return {column: values[column] for column in self.columns}
+
+
+# Columns with only few distinct values, each repeated on many rows.
+_CATEGORICAL_COLUMNS = ("qid", "query", "index", "target_hostname", "content_type", "language")
+
+# Columns with mostly distinct strings, which Arrow stores without a Python object per value.
+_STRING_COLUMNS = (
+    "docno", "trec_id", "warc_id", "target_uri", "cache_uri", "title_highlighted", "title_text",
+    "snippet_highlighted", "snippet_text", "contents", "text", "contents_plain",
+)
+
+_has_pyarrow = find_spec("pyarrow") is not None
+
+# Operators of the query syntax that must stay upper case.
+_CASE_SENSITIVE_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def _normalize_query(query: str, normalize_case: bool) -> str:
+    terms = query.split()
+    if normalize_case and _CASE_SENSITIVE_OPERATORS.isdisjoint(terms):
+        # The ChatNoir analyzers lower-case all terms, so case does not change the results.
+        terms = [term.casefold() for term in terms]
+    return " ".join(terms)
+
 
 @dataclass
 class ChatNoirRetrieve(Transformer):
@@ -37,205 +204,1224 @@ class ChatNoirRetrieve(Transformer):
     verbose: bool = False
     api_key: str = DEFAULT_API_KEY
     search_method: SearchMethod = DEFAULT_SEARCH_METHOD
+    max_workers: int = 1
+    max_content_workers: int = 1
+    content_cache: Optional[DocumentContentCache] = None
+    result_cache: Optional[ResultCache] = None
+    prefetch_pages: int = 0
+    requests_per_second: Optional[float] = None
+    max_concurrency: Optional[int] = None
+    session: Optional[ChatNoirSession] = None
+    cassette: Optional[Cassette] = None
+    checkpoint: Optional[Checkpoint] = None
+    batch_size: Optional[int] = None
+    fan_out: bool = False
+    num_results_per_index: Optional[Mapping[Index, int]] = None
+    fusion: FusionMethod = "score"
+    rrf_k: int = 60
+    deduplicate_queries: bool = True
+    normalize_case: bool = False
+    compact: bool = False
+    backend: ShardBackend = "thread"
+    n_shards: int = 1
+    collect_stats: bool = False
+    stats_hooks: Sequence[StatsHook] = ()
+    pages_fetched: Dict[Any, int] = field(
+        default_factory=dict,
+        init=False,
+        repr=False,
+        compare=False,
+    )
+    stats: RetrievalStats = field(
+        default_factory=lambda: NULL_STATS,
+        init=False,
+        repr=False,
+        compare=False,
+    )
+    _plan: _FeaturePlan = field(
+        init=False,
+        repr=False,
+        compare=False,
+    )
 
-    def _merge_result(
-        self,
-        row: Dict[str, Any],
-        result: Union[
-            Result, ExplainedResult,
-        ]
-    ) -> Dict[str, Any]:
-        row = {
-            **row,
-            "docno": result.trec_id,
-            "score": result.score,
-        }
-        if Feature.UUID in self.features:
-            row["uuid"] = result.uuid
-        if Feature.TREC_ID in self.features:
-            row["trec_id"] = result.trec_id
-        if Feature.WARC_ID in self.features:
-            row["warc_id"] = result.warc_id
-        if Feature.INDEX in self.features:
-            row["index"] = result.index
-        if Feature.CRAWL_DATE in self.features:
-            row["crawl_date"] = result.crawl_date
-        if Feature.TARGET_HOSTNAME in self.features:
-            row["target_hostname"] = result.target_hostname
-        if Feature.TARGET_URI in self.features:
-            row["target_uri"] = result.target_uri
-        if Feature.CACHE_URI in self.features:
-            row["cache_uri"] = result.cache_uri
-        if Feature.PAGE_RANK in self.features:
-            row["page_rank"] = result.page_rank
-        if Feature.SPAM_RANK in self.features:
-            row["spam_rank"] = result.spam_rank
-        if Feature.TITLE_HIGHLIGHTED in self.features:
-            row["title_highlighted"] = result.title.html
-        if Feature.TITLE_TEXT in self.features:
-            row["title_text"] = result.title.text
-        if Feature.SNIPPET_HIGHLIGHTED in self.features:
-            row["snippet_highlighted"] = result.snippet.html
-        if Feature.SNIPPET_TEXT in self.features:
-            row["snippet_text"] = result.snippet.text
-        if Feature.EXPLANATION in self.features:
-            if not isinstance(result, ExplainedResult):
-                raise RuntimeError(f"Unexpected response type: {type(result)}, expected: {type(ExplainedResult)}")
-            row["explanation"] = result.explanation
-        if Feature.CONTENTS in self.features:
-            try:
-                row["contents"] = result.cache_contents(plain=False)
-            except Exception:
-                row["contents"] = None
-        if Feature.CONTENTS_PLAIN in self.features:
-            try:
-                row["text"] = row["contents_plain"] = result.cache_contents(plain=True)
-            except Exception:
-                row["text"] = row["contents_plain"] = None
-        if Feature.CONTENT_TYPE in self.features:
-            row["content_type"] = result.content_type
-        if Feature.LANGUAGE in self.features:
-            row["language"] = result.language
-        return row
+    @property
+    def rate_limiter(self) -> Optional[RateLimiter]:
+        if self.requests_per_second is None and self.max_concurrency is None:
+            return None
+        return shared_rate_limiter(
+            api_key=self.api_key,
+            requests_per_second=self.requests_per_second,
+            max_concurrency=self.max_concurrency,
+        )
 
-    def _transform_query(self, topic: DataFrame) -> DataFrame:
-        if len(topic.index) != 1:
-            raise RuntimeError("Can only transform one query at a time.")
+    def _start_stats(self) -> None:
+        if self.collect_stats or len(self.stats_hooks) > 0:
+            self.stats = RetrievalStats(self.stats_hooks)
+        else:
+            self.stats = NULL_STATS
 
-        row: Dict[str, Any] = topic.to_dict(orient="records")[0]
-        query: str = row["query"]
+    def _get_session(self) -> ChatNoirSession:
+        if self.session is not None:
+            return self.session
+        return default_session()
 
-        page_size: int
-        if self.num_results is not None:
-            page_size = min(self.page_size, self.num_results)
-        else:
-            page_size = self.page_size
+    def _map(
+        self,
+        function: Callable[[_T], _U],
+        items: Sequence[_T],
+        max_workers: int,
+        verbose: bool,
+        desc: str,
+        unit: str,
+    ) -> List[_U]:
+        results: Iterable[_U]
+        if max_workers > 1:
+            # Run concurrently, but keep the items' order.
+            with ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="chatnoir",
+            ) as executor:
+                results = executor.map(function, items)
+                if verbose:
+                    results = tqdm(results, desc=desc, unit=unit, total=len(items))
+                return list(results)
+        results = map(function, items)
+        if verbose:
+            results = tqdm(results, desc=desc, unit=unit, total=len(items))
+        return list(results)
 
-        features: Feature
-        if isinstance(self.features, Set):
-            features = reduce(
-                lambda feature_a, feature_b: feature_a | feature_b,
-                self.features
-            )
-        else:
-            features = self.features
+    async def _agather(
+        self,
+        function: Callable[[_T], Awaitable[_U]],
+        items: Sequence[_T],
+        max_workers: int,
+        verbose: bool,
+        desc: str,
+        unit: str,
+    ) -> List[_U]:
+        # Run at most max_workers coroutines at once, but keep the items' order.
+        semaphore = Semaphore(max_workers)
+        with tqdm(desc=desc, unit=unit, total=len(items), disable=not verbose) as progress:
+            async def run(item: _T) -> _U:
+                async with semaphore:
+                    result = await function(item)
+                progress.update()
+                return result
 
-        explain: bool = Feature.EXPLANATION in features
+            return list(await gather(*(run(item) for item in items)))
 
-        results: Iterable[Union[
-            Result, ExplainedResult,
-        ]]
-        if not self.phrases:
-            if explain:
-                results = search(
-                    query=query,
-                    index=self.index,
-                    minimal=False,
-                    explain=True,
-                    extended_meta=False,
-                    page_size=page_size,
+    def _cached_contents(self, key: _ContentsKey, docno: str) -> Optional[str]:
+        if self.content_cache is None:
+            return None
+        _, index, plain = key
+        contents = self.content_cache.get(index, docno, plain)
+        self.stats.count("content_cache_misses" if contents is None else "content_cache_hits")
+        return contents
+
+    def _cache_contents(self, key: _ContentsKey, docno: str, contents: str) -> None:
+        if self.stats.enabled:
+            self.stats.count("documents")
+            self.stats.count("content_bytes", len(contents.encode("utf-8")))
+        if self.content_cache is None:
+            return
+        _, index, plain = key
+        self.content_cache.set(index, docno, plain, contents)
+
+    def _fetch_document_contents(
+        self,
+        key_and_docno: Tuple[_ContentsKey, str],
+    ) -> Optional[str]:
+        key, docno = key_and_docno
+        cached = self._cached_contents(key, docno)
+        if cached is not None:
+            return cached
+        uuid, index, plain = key
+        try:
+            with self.stats.time("contents"):
+                contents = self._get_session().cache_contents(
+                    uuid=uuid,
+                    index=index,
+                    plain=plain,
                     retries=self.retries,
                     backoff_seconds=self.backoff_seconds,
-                    api_key=self.api_key,
-                    search_method=self.search_method
-                ).results
-            else:
-                results = search(
-                    query=query,
-                    index=self.index,
-                    minimal=False,
-                    explain=False,
-                    extended_meta=False,
-                    page_size=page_size,
+                    rate_limiter=self.rate_limiter,
+                    stats=self.stats,
+                    cassette=self.cassette,
+                )
+        except CassetteMissError:
+            # Replaying must not silently return empty contents.
+            raise
+        except Exception:
+            self.stats.count("content_errors")
+            return None
+        self._cache_contents(key, docno, contents)
+        return contents
+
+    async def _afetch_document_contents(
+        self,
+        key_and_docno: Tuple[_ContentsKey, str],
+    ) -> Optional[str]:
+        key, docno = key_and_docno
+        cached = await _run_blocking(self._cached_contents, key, docno) \
+            if self.content_cache is not None else None
+        if cached is not None:
+            return cached
+        uuid, index, plain = key
+        try:
+            with self.stats.time("contents"):
+                contents = await self._get_session().acache_contents(
+                    uuid=uuid,
+                    index=index,
+                    plain=plain,
                     retries=self.retries,
                     backoff_seconds=self.backoff_seconds,
-                    api_key=self.api_key,
-                    search_method=self.search_method
-                ).results
+                    rate_limiter=self.rate_limiter,
+                    stats=self.stats,
+                    cassette=self.cassette,
+                )
+        except CassetteMissError:
+            # Replaying must not silently return empty contents.
+            raise
+        except Exception:
+            self.stats.count("content_errors")
+            return None
+        if self.content_cache is not None:
+            await _run_blocking(self._cache_contents, key, docno, contents)
         else:
-            if explain:
-                results = search_phrases(
-                    query=query,
-                    index=self.index,
-                    minimal=False,
-                    slop=self.slop,
-                    explain=True,
-                    extended_meta=False,
-                    page_size=page_size,
-                    retries=self.retries,
-                    backoff_seconds=self.backoff_seconds,
-                    api_key=self.api_key,
-                    search_method=self.search_method
-                ).results
-            else:
-                results = search_phrases(
-                    query=query,
-                    index=self.index,
-                    minimal=False,
-                    slop=self.slop,
-                    explain=False,
-                    extended_meta=False,
-                    page_size=page_size,
-                    retries=self.retries,
-                    backoff_seconds=self.backoff_seconds,
-                    api_key=self.api_key,
-                    search_method=self.search_method
-                ).results
+            self._cache_contents(key, docno, contents)
+        return contents
+
+    def _contents_keys(
+        self,
+        results: Iterable[Union[
+            Result, ExplainedResult,
+        ]],
+    ) -> List[Tuple[_ContentsKey, str]]:
+        plan = self._feature_plan
+        fetch_contents = plan.fetch_contents
+        fetch_contents_plain = plan.fetch_contents_plain
+        if not fetch_contents and not fetch_contents_plain:
+            return []
+
+        # Collect each document only once, even if retrieved for multiple queries.
+        docnos: Dict[_ContentsKey, str] = {}
+        for result in results:
+            # Fall back to the UUID if the TREC ID is unknown.
+            docno = result.trec_id if result.trec_id is not None else str(result.uuid)
+            if fetch_contents:
+                docnos[(result.uuid, result.index, False)] = docno
+            if fetch_contents_plain:
+                docnos[(result.uuid, result.index, True)] = docno
+        return list(docnos.items())
+
+    def _fetch_contents(
+        self,
+        results: Iterable[Union[
+            Result, ExplainedResult,
+        ]],
+        verbose: bool,
+    ) -> Dict[_ContentsKey, Optional[str]]:
+        return self._fetch_contents_by_key(self._contents_keys(results), verbose)
+
+    def _fetch_contents_by_key(
+        self,
+        keys_and_docnos: Sequence[Tuple[_ContentsKey, str]],
+        verbose: bool,
+    ) -> Dict[_ContentsKey, Optional[str]]:
+        contents = self._map(
+            self._fetch_document_contents,
+            keys_and_docnos,
+            max_workers=self.max_content_workers,
+            verbose=verbose,
+            desc="Fetching contents from ChatNoir",
+            unit="document",
+        )
+        return {
+            key: document_contents
+            for (key, _), document_contents in zip(keys_and_docnos, contents)
+        }
+
+    async def _afetch_contents(
+        self,
+        results: Iterable[Union[
+            Result, ExplainedResult,
+        ]],
+        verbose: bool,
+    ) -> Dict[_ContentsKey, Optional[str]]:
+        return await self._afetch_contents_by_key(self._contents_keys(results), verbose)
+
+    async def _afetch_contents_by_key(
+        self,
+        keys_and_docnos: Sequence[Tuple[_ContentsKey, str]],
+        verbose: bool,
+    ) -> Dict[_ContentsKey, Optional[str]]:
+        contents = await self._agather(
+            self._afetch_document_contents,
+            keys_and_docnos,
+            max_workers=self.max_content_workers,
+            verbose=verbose,
+            desc="Fetching contents from ChatNoir",
+            unit="document",
+        )
+        return {
+            key: document_contents
+            for (key, _), document_contents in zip(keys_and_docnos, contents)
+        }
+
+    def __post_init__(self):
+        if self.n_shards < 1:
+            raise ValueError("Number of shards must be positive.")
+        if self.cassette is not None and self.n_shards > 1 and self.backend != "thread":
+            raise ValueError("Cannot record or replay a cassette in multiple processes.")
+        self._plan = _FeaturePlan.compile(self.features, self.fan_out)
+
+    @property
+    def _feature_plan(self) -> _FeaturePlan:
+        # Recompile only if the features were replaced after construction.
+        plan = self._plan
+        if plan.source is not self.features or plan.fan_out != self.fan_out:
+            plan = self._plan = _FeaturePlan.compile(self.features, self.fan_out)
+        return plan
+
+    @property
+    def result_columns(self) -> Tuple[str, ...]:
+        # Columns added to each topic row, known before retrieving.
+        return self._feature_plan.columns + ("rank",)
+
+    def _merge_results(
+        self,
+        searched: Sequence[Tuple[
+            Dict[str, Any],
+            List[Union[Result, ExplainedResult]],
+        ]],
+        contents: Dict[_ContentsKey, Optional[str]],
+    ) -> DataFrame:
+        with self.stats.time("merge"):
+            return self._merge_columns(searched, contents)
+
+    def _merge_columns(
+        self,
+        searched: Sequence[Tuple[
+            Dict[str, Any],
+            List[Union[Result, ExplainedResult]],
+        ]],
+        contents: Dict[_ContentsKey, Optional[str]],
+    ) -> DataFrame:
+        topics = DataFrame([row for row, _ in searched])
+        counts = array([len(results) for _, results in searched], dtype=int64)
+        results = [
+            result
+            for _, results in searched
+            for result in results
+        ]
+
+        # Repeat the topic columns for each query's results, instead of copying each row.
+        columns: Dict[str, Any] = {
+            column: topics[column].to_numpy().repeat(counts)
+            for column in topics.columns
+        }
+        columns.update(self._feature_plan.extract(results, contents))
+
+        # ChatNoir returns each query's results in ranked order, so no need to sort by score.
+        # The results stay grouped by query, in the order of the topics.
+        offsets = cumsum(counts) - counts
+        columns["rank"] = arange(len(results)) - offsets.repeat(counts) + FIRST_RANK
+        return self._compact_results(DataFrame(columns))
 
+    def _compact_results(self, results: DataFrame) -> DataFrame:
+        if not self.compact:
+            return results
+        # Store each distinct value only once, and scores with single precision.
+        dtypes: Dict[str, Any] = {
+            column: "category"
+            for column in _CATEGORICAL_COLUMNS
+            if column in results.columns and results[column].dtype != "category"
+        }
+        if _has_pyarrow:
+            dtypes.update({
+                column: "string[pyarrow]"
+                for column in _STRING_COLUMNS
+                if column in results.columns
+            })
+        if "score" in results.columns:
+            dtypes["score"] = float32
+        return results.astype(dtypes, copy=False)
+
+    def _result_cache_key(self, query: str, explain: bool) -> str:
+        # Only include the parameters that affect which results are returned.
+        # Python's hash() is salted per process, so use a stable digest instead.
+        # The number of results is not part of the key so that
+        # shallower searches can be served from deeper cached results.
+        config = dumps([
+            sorted(self.index) if isinstance(self.index, Set) else [self.index],
+            self.phrases,
+            self.slop if self.phrases else None,
+            explain,
+            self.filter_unknown,
+            self.search_method,
+            query,
+        ])
+        return sha256(config.encode("utf-8")).hexdigest()
+
+    def _search_page(
+        self,
+        query: str,
+        explain: bool,
+        start: int,
+        size: int,
+    ) -> Results[Meta, Union[Result, ExplainedResult]]:
+        with self.stats.time("search_page"):
+            return self._get_session().search_page(
+                query=query,
+                index=self.index,
+                phrases=self.phrases,
+                slop=self.slop,
+                explain=explain,
+                start=start,
+                size=size,
+                api_key=self.api_key,
+                search_method=self.search_method,
+                retries=self.retries,
+                backoff_seconds=self.backoff_seconds,
+                rate_limiter=self.rate_limiter,
+                stats=self.stats,
+                cassette=self.cassette,
+            )
+
+    async def _asearch_page(
+        self,
+        query: str,
+        explain: bool,
+        start: int,
+        size: int,
+    ) -> Results[Meta, Union[Result, ExplainedResult]]:
+        with self.stats.time("search_page"):
+            return await self._get_session().asearch_page(
+                query=query,
+                index=self.index,
+                phrases=self.phrases,
+                slop=self.slop,
+                explain=explain,
+                start=start,
+                size=size,
+                api_key=self.api_key,
+                search_method=self.search_method,
+                retries=self.retries,
+                backoff_seconds=self.backoff_seconds,
+                rate_limiter=self.rate_limiter,
+                stats=self.stats,
+                cassette=self.cassette,
+            )
+
+    def _page_size(self) -> int:
+        if self.num_results is not None:
+            return min(self.page_size, self.num_results)
+        return self.page_size
+
+    def _needed_results(self, total_results: int) -> int:
+        # Pages starting before this offset are needed in any case,
+        # because filtering can only remove results.
+        if self.num_results is not None:
+            return min(total_results, self.num_results)
+        return total_results
+
+    def _add_page_results(
+        self,
+        results: List[Union[Result, ExplainedResult]],
+        page: Results[Meta, Union[Result, ExplainedResult]],
+    ) -> bool:
         if self.filter_unknown:
             # Filter unknown results, i.e., when the TREC ID is missing.
-            results = (
+            results.extend(
                 result
-                for result in results
+                for result in page.results
                 if result.trec_id is not None
             )
-            pass
+        else:
+            results.extend(page.results)
+
+        if self.num_results is not None and len(results) >= self.num_results:
+            # Stop early, as soon as enough results were found.
+            del results[self.num_results:]
+            return True
+        return False
+
+    def _search_results(
+        self,
+        query: str,
+        explain: bool,
+        stop: Optional[Callable[[Sequence[Union[Result, ExplainedResult]]], bool]] = None,
+    ) -> Tuple[List[Union[Result, ExplainedResult]], int]:
+        page_size = self._page_size()
+
+        results: List[Union[Result, ExplainedResult]] = []
+        page = self._search_page(query, explain, 0, page_size)
+        pages = 1
+        total_results = page.meta.total_results
+        next_start = page_size
+        needed_results = self._needed_results(total_results)
+
+        pending: Deque["Future[Results[Meta, Union[Result, ExplainedResult]]]"] = deque()
+        executor: Optional[ThreadPoolExecutor] = None
+        if self.prefetch_pages > 0 and needed_results > page_size:
+            executor = ThreadPoolExecutor(
+                max_workers=self.prefetch_pages,
+                thread_name_prefix="chatnoir-page",
+            )
+        try:
+            while True:
+                if executor is not None:
+                    # Fetch the next pages in the background while processing the current page.
+                    while len(pending) < self.prefetch_pages and next_start < needed_results:
+                        pending.append(executor.submit(
+                            self._search_page, query, explain, next_start, page_size,
+                        ))
+                        pages += 1
+                        next_start += page_size
+
+                if self._add_page_results(results, page):
+                    break
+                if stop is not None and stop(results):
+                    # The caller already found what it needs.
+                    break
+                if pending:
+                    page = pending.popleft().result()
+                elif next_start < total_results:
+                    page = self._search_page(query, explain, next_start, page_size)
+                    pages += 1
+                    next_start += page_size
+                else:
+                    break
+        finally:
+            for future in pending:
+                if future.cancel():
+                    pages -= 1
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+        return results, pages
+
+    async def _asearch_results(
+        self,
+        query: str,
+        explain: bool,
+        stop: Optional[Callable[[Sequence[Union[Result, ExplainedResult]]], bool]] = None,
+    ) -> Tuple[List[Union[Result, ExplainedResult]], int]:
+        page_size = self._page_size()
+
+        results: List[Union[Result, ExplainedResult]] = []
+        page = await self._asearch_page(query, explain, 0, page_size)
+        pages = 1
+        total_results = page.meta.total_results
+        next_start = page_size
+        needed_results = self._needed_results(total_results)
+
+        pending: Deque["Task[Results[Meta, Union[Result, ExplainedResult]]]"] = deque()
+        try:
+            while True:
+                # Fetch the next pages in the background while processing the current page.
+                while len(pending) < self.prefetch_pages and next_start < needed_results:
+                    pending.append(ensure_future(
+                        self._asearch_page(query, explain, next_start, page_size),
+                    ))
+                    pages += 1
+                    next_start += page_size
 
+                if self._add_page_results(results, page):
+                    break
+                if stop is not None and stop(results):
+                    # The caller already found what it needs.
+                    break
+                if pending:
+                    page = await pending.popleft()
+                elif next_start < total_results:
+                    page = await self._asearch_page(query, explain, next_start, page_size)
+                    pages += 1
+                    next_start += page_size
+                else:
+                    break
+        finally:
+            for task in pending:
+                if task.cancel():
+                    pages -= 1
+
+        return results, pages
+
+    def _cached_results(self, query: str, explain: bool) -> Tuple[
+        Optional[str],
+        Optional[List[Union[Result, ExplainedResult]]],
+    ]:
+        if self.result_cache is None:
+            return None, None
+        cache_key = self._result_cache_key(query, explain)
+        cached_results = self.result_cache.get(cache_key, self.num_results)
+        if cached_results is None:
+            self.stats.count("result_cache_misses")
+            return cache_key, None
+        self.stats.count("result_cache_hits")
+        return cache_key, list(cached_results)
+
+    def _searched(
+        self,
+        row: Dict[str, Any],
+        results: List[Union[Result, ExplainedResult]],
+        pages: int,
+    ) -> None:
+        self.pages_fetched[row["qid"]] = pages
+        self.stats.count("queries")
+        self.stats.count("pages", pages)
+        self.stats.count("hits", len(results))
+        if self.content_cache is not None and self.content_cache.store_metadata:
+            # Remember the documents' metadata, to look it up later without a query.
+            self.content_cache.set_metadata(results)
+
+    async def _asearched(
+        self,
+        row: Dict[str, Any],
+        results: List[Union[Result, ExplainedResult]],
+        pages: int,
+    ) -> None:
+        if self.content_cache is not None and self.content_cache.store_metadata:
+            await _run_blocking(self._searched, row, results, pages)
+        else:
+            self._searched(row, results, pages)
+
+    @staticmethod
+    def _topic_row(topic: DataFrame) -> Dict[str, Any]:
+        if len(topic.index) != 1:
+            raise RuntimeError("Can only transform one query at a time.")
+        return topic.to_dict(orient="records")[0]
+
+    def _index_retrievers(self) -> List["ChatNoirRetrieve"]:
+        indices = sorted(self.index) if isinstance(self.index, Set) else [self.index]
+        retrievers: List[ChatNoirRetrieve] = []
+        for index in indices:
+            num_results = self.num_results
+            if self.num_results_per_index is not None and index in self.num_results_per_index:
+                num_results = self.num_results_per_index[index]
+            retriever = replace(self, index=index, num_results=num_results, fan_out=False)
+            retriever.stats = self.stats
+            retrievers.append(retriever)
+        return retrievers
+
+    def _fuse_results(
+        self,
+        retrievers: Sequence["ChatNoirRetrieve"],
+        searched: Sequence[Tuple[
+            Dict[str, Any],
+            List[Union[Result, ExplainedResult]],
+        ]],
+    ) -> Tuple[
+        Dict[str, Any],
+        List[Union[Result, ExplainedResult]],
+    ]:
+        row = searched[0][0]
+        self.pages_fetched[row["qid"]] = sum(
+            retriever.pages_fetched[row["qid"]]
+            for retriever in retrievers
+        )
+        results = fuse(
+            [results for _, results in searched],
+            method=self.fusion,
+            rrf_k=self.rrf_k,
+        )
         if self.num_results is not None:
-            results = islice(results, self.num_results)
+            del results[self.num_results:]
+        return row, results
 
-        return DataFrame([
-            self._merge_result(row, result)
-            for result in results
-        ])
+    def _fan_out_search_query(self, row: Dict[str, Any]) -> Tuple[
+        Dict[str, Any],
+        List[Union[Result, ExplainedResult]],
+    ]:
+        # Search each index in parallel, with its own number of results.
+        retrievers = self._index_retrievers()
+        searched = self._map(
+            lambda retriever: retriever._search_query(row),
+            retrievers,
+            max_workers=len(retrievers),
+            verbose=False,
+            desc="Searching indices",
+            unit="index",
+        )
+        return self._fuse_results(retrievers, searched)
 
-    def transform(self, topics: DataFrame) -> DataFrame:
+    async def _afan_out_search_query(self, row: Dict[str, Any]) -> Tuple[
+        Dict[str, Any],
+        List[Union[Result, ExplainedResult]],
+    ]:
+        retrievers = self._index_retrievers()
+        searched = await gather(*(
+            retriever._asearch_query(row)
+            for retriever in retrievers
+        ))
+        return self._fuse_results(retrievers, searched)
+
+    def _search_query(self, row: Dict[str, Any]) -> Tuple[
+        Dict[str, Any],
+        List[Union[Result, ExplainedResult]],
+    ]:
+        if self.fan_out:
+            return self._fan_out_search_query(row)
+
+        query: str = row["query"]
+
+        explain: bool = self._feature_plan.explain
+
+        cache_key, cached_results = self._cached_results(query, explain)
+        if cached_results is not None:
+            self.pages_fetched[row["qid"]] = 0
+            return row, cached_results
+
+        with self.stats.time("search"):
+            results, pages = self._search_results(query, explain)
+        self._searched(row, results, pages)
+
+        if self.result_cache is not None and cache_key is not None:
+            self.result_cache.set(cache_key, self.num_results, results)
+
+        return row, results
+
+    async def _asearch_query(self, row: Dict[str, Any]) -> Tuple[
+        Dict[str, Any],
+        List[Union[Result, ExplainedResult]],
+    ]:
+        if self.fan_out:
+            return await self._afan_out_search_query(row)
+
+        query: str = row["query"]
 
+        explain: bool = self._feature_plan.explain
+
+        cache_key, cached_results = await _run_blocking(self._cached_results, query, explain) \
+            if self.result_cache is not None else (None, None)
+        if cached_results is not None:
+            self.pages_fetched[row["qid"]] = 0
+            return row, cached_results
+
+        with self.stats.time("search"):
+            results, pages = await self._asearch_results(query, explain)
+        await self._asearched(row, results, pages)
+
+        if self.result_cache is not None and cache_key is not None:
+            await _run_blocking(self.result_cache.set, cache_key, self.num_results, results)
+
+        return row, results
+
+    def _batch_starts(
+        self,
+        total_results: Optional[int],
+        next_start: int,
+        page_size: int,
+    ) -> List[int]:
+        if total_results is None:
+            # The first page tells how many results there are.
+            return [0]
+        needed_results = self._needed_results(total_results)
+        starts = list(range(
+            next_start,
+            min(needed_results, next_start + (1 + self.prefetch_pages) * page_size),
+            page_size,
+        ))
+        if len(starts) == 0:
+            # Filtering removed results, so request more pages one at a time.
+            starts = [next_start]
+        return starts
+
+    def _search_batches(
+        self,
+        rows: Sequence[Dict[str, Any]],
+        verbose: bool,
+    ) -> List[Tuple[
+        Dict[str, Any],
+        List[Union[Result, ExplainedResult]],
+    ]]:
+        if self.batch_size is None or self.batch_size < 1:
+            raise ValueError("Batch size must be positive.")
+        explain: bool = self._feature_plan.explain
+        page_size = self._page_size()
+
+        cache_keys: List[Optional[str]] = []
+        searched: List[List[Union[Result, ExplainedResult]]] = []
+        uncached: Deque[int] = deque()
+        for i, row in enumerate(rows):
+            cache_key, cached_results = self._cached_results(row["query"], explain)
+            cache_keys.append(cache_key)
+            if cached_results is not None:
+                self.pages_fetched[row["qid"]] = 0
+                searched.append(cached_results)
+            else:
+                searched.append([])
+                uncached.append(i)
+
+        pages: Dict[int, int] = {}
+        next_starts: Dict[int, int] = {}
+        consumed_starts: Dict[int, int] = {}
+        total_results: Dict[int, int] = {}
+        finished: Set[int] = set()
+        in_flight: Dict[int, int] = {}
+        received: Dict[int, Dict[int, Results[Meta, Union[Result, ExplainedResult]]]] = {}
+        pending: Dict["Future[Results[Meta, Union[Result, ExplainedResult]]]", Tuple[int, int]] = {}
+
+        def submit_pages(i: int) -> None:
+            starts = self._batch_starts(total_results.get(i), next_starts[i], page_size)
+            for start in starts:
+                future = executor.submit(self._search_page, rows[i]["query"], explain, start, page_size)
+                pending[future] = (i, start)
+            pages[i] += len(starts)
+            in_flight[i] += len(starts)
+            next_starts[i] = starts[-1] + page_size
+
+        def start_query() -> None:
+            i = uncached.popleft()
+            pages[i] = next_starts[i] = consumed_starts[i] = in_flight[i] = 0
+            received[i] = {}
+            submit_pages(i)
+
+        def receive_page(i: int, start: int, page: Results[Meta, Union[Result, ExplainedResult]]) -> bool:
+            # Add the pages in order, as soon as all previous pages of the query arrived.
+            in_flight[i] -= 1
+            received[i][start] = page
+            while i not in finished and consumed_starts[i] in received[i]:
+                page = received[i].pop(consumed_starts[i])
+                consumed_starts[i] += page_size
+                total_results[i] = page.meta.total_results
+                if self._add_page_results(searched[i], page):
+                    finished.add(i)
+            if in_flight[i] > 0:
+                return False
+            if i not in finished and next_starts[i] < total_results[i]:
+                # Request the query's next pages right away, without waiting for other queries.
+                submit_pages(i)
+                return False
+            return True
+
+        with self.stats.time("search_batch"), ThreadPoolExecutor(
+            max_workers=self.batch_size,
+            thread_name_prefix="chatnoir-batch",
+        ) as executor, tqdm(
+            desc="Searching with ChatNoir",
+            unit="query",
+            total=len(rows),
+            disable=not verbose,
+        ) as progress:
+            progress.update(len(rows) - len(uncached))
+            try:
+                # Keep up to the batch size of queries in flight, starting the next query as soon as one is done.
+                while len(uncached) > 0 and len(in_flight) < self.batch_size:
+                    start_query()
+                while len(pending) > 0:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i, start = pending.pop(future)
+                        if not receive_page(i, start, future.result()):
+                            continue
+                        del in_flight[i]
+                        received.pop(i)
+                        progress.update(1)
+                        if len(uncached) > 0:
+                            start_query()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        for i, (row, results) in enumerate(zip(rows, searched)):
+            if i not in pages:
+                continue
+            self._searched(row, results, pages[i])
+            cache_key = cache_keys[i]
+            if self.result_cache is not None and cache_key is not None:
+                self.result_cache.set(cache_key, self.num_results, results)
+        return list(zip(rows, searched))
+
+    def _deduplicate_queries(
+        self,
+        queries: Sequence[Dict[str, Any]],
+    ) -> Tuple[List[Dict[str, Any]], List[int]]:
+        # Return the distinct queries and, for each topic, the position of its distinct query.
+        if not self.deduplicate_queries:
+            return list(queries), list(range(len(queries)))
+        distinct_queries: List[Dict[str, Any]] = []
+        positions: List[int] = []
+        distinct_positions: Dict[str, int] = {}
+        for row in queries:
+            key = _normalize_query(str(row["query"]), self.normalize_case)
+            position = distinct_positions.get(key)
+            if position is None:
+                position = len(distinct_queries)
+                distinct_positions[key] = position
+                distinct_queries.append(row)
+            positions.append(position)
+        return distinct_queries, positions
+
+    def _duplicate_results(
+        self,
+        queries: Sequence[Dict[str, Any]],
+        searched: Sequence[Tuple[
+            Dict[str, Any],
+            List[Union[Result, ExplainedResult]],
+        ]],
+        positions: Sequence[int],
+    ) -> List[Tuple[
+        Dict[str, Any],
+        List[Union[Result, ExplainedResult]],
+    ]]:
+        # Share the distinct queries' results with all topics of the same query.
+        duplicated: List[Tuple[
+            Dict[str, Any],
+            List[Union[Result, ExplainedResult]],
+        ]] = []
+        seen: Set[int] = set()
+        for row, position in zip(queries, positions):
+            if position not in seen:
+                seen.add(position)
+                duplicated.append(searched[position])
+                continue
+            distinct_row, results = searched[position]
+            self.stats.count("duplicate_queries")
+            self.stats.count("requests_saved", self.pages_fetched.get(distinct_row["qid"], 0))
+            self.pages_fetched[row["qid"]] = 0
+            duplicated.append((row, list(results)))
+        return duplicated
+
+    def _transform_query(self, topic: DataFrame) -> DataFrame:
+        row, results = self._search_query(self._topic_row(topic))
+        contents = self._fetch_contents(results, verbose=False)
+        return self._merge_results([(row, results)], contents)
+
+    @staticmethod
+    def _check_topics(topics: DataFrame) -> None:
         if not isinstance(topics, DataFrame):
             raise RuntimeError("Can only transform dataframes.")
 
         if not {'qid', 'query'}.issubset(topics.columns):
             raise RuntimeError("Needs qid and query columns.")
 
-        if len(topics) == 0:
-            return self._transform_query(topics)
+        if topics["qid"].duplicated().any():
+            raise RuntimeError("Can only transform one query at a time.")
 
-        topics_by_query: DataFrameGroupBy = topics.groupby(
-            by=["qid"],
-            as_index=False,
-            sort=False,
-        )
+    @staticmethod
+    def _split_queries(topics: DataFrame) -> List[Dict[str, Any]]:
+        # Convert all topic rows at once, as converting each row separately is much slower.
+        return topics.to_dict(orient="records")
 
-        retrieved: DataFrame
-        if self.verbose:
-            # Show progress during reranking queries.
-            tqdm.pandas(
+    def _transform_queries(
+        self,
+        queries: Sequence[Dict[str, Any]],
+        verbose: bool,
+    ) -> DataFrame:
+        distinct_queries, positions = self._deduplicate_queries(queries)
+        searched: List[Tuple[
+            Dict[str, Any],
+            List[Union[Result, ExplainedResult]],
+        ]]
+        if self.batch_size is not None and not self.fan_out:
+            searched = self._search_batches(distinct_queries, verbose)
+        else:
+            searched = self._map(
+                self._search_query,
+                distinct_queries,
+                max_workers=self.max_workers,
+                verbose=verbose,
                 desc="Searching with ChatNoir",
                 unit="query",
             )
-            retrieved = topics_by_query.progress_apply(
-                self._transform_query
-            )
-        else:
-            retrieved = topics_by_query.apply(self._transform_query)
+        searched = self._duplicate_results(queries, searched, positions)
+
+        # Fetch the contents for all queries at once.
+        contents = self._fetch_contents(
+            (
+                result
+                for _, results in searched
+                for result in results
+            ),
+            verbose=verbose,
+        )
+
+        return self._merge_results(searched, contents)
+
+    async def _atransform_queries(
+        self,
+        queries: Sequence[Dict[str, Any]],
+        verbose: bool,
+    ) -> DataFrame:
+        distinct_queries, positions = self._deduplicate_queries(queries)
+        searched = await self._agather(
+            self._asearch_query,
+            distinct_queries,
+            max_workers=self.max_workers,
+            verbose=verbose,
+            desc="Searching with ChatNoir",
+            unit="query",
+        )
+        searched = self._duplicate_results(queries, searched, positions)
+
+        # Fetch the contents for all queries at once.
+        contents = await self._afetch_contents(
+            (
+                result
+                for _, results in searched
+                for result in results
+            ),
+            verbose=verbose,
+        )
+
+        return self._merge_results(searched, contents)
+
+    def _checkpoint_key(self, row: Dict[str, Any]) -> str:
+        plan = self._feature_plan
+        # Besides the parameters of the result cache key, include all parameters that affect the result rows.
+        config = dumps([
+            self._result_cache_key(str(row["query"]), plan.explain),
+            str(row["qid"]),
+            self.num_results,
+            plan.features.value,
+            self.fan_out,
+            sorted(self.num_results_per_index.items()) if self.num_results_per_index is not None else None,
+            self.fusion,
+            self.rrf_k,
+            self.compact,
+        ])
+        return sha256(config.encode("utf-8")).hexdigest()
+
+    def _restore_checkpoint(
+        self,
+        queries: Sequence[Dict[str, Any]],
+    ) -> Tuple[List[str], List[Optional[DataFrame]], List[Dict[str, Any]]]:
+        # Return the queries' checkpoint keys, their checkpointed results, and the queries still to search.
+        if self.checkpoint is None:
+            raise RuntimeError("No checkpoint configured.")
+        keys = [self._checkpoint_key(row) for row in queries]
+        restored = [self.checkpoint.get(key) for key in keys]
+        pending: List[Dict[str, Any]] = []
+        for row, results in zip(queries, restored):
+            if results is None:
+                pending.append(row)
+            else:
+                self.pages_fetched[row["qid"]] = 0
+                self.stats.count("checkpointed_queries")
+        return keys, restored, pending
+
+    def _merge_topic(self, row: Dict[str, Any], results: DataFrame) -> DataFrame:
+        # Repeat the current topic row for each restored result, like when merging searched results.
+        topics = DataFrame([row])
+        columns: Dict[str, Any] = {
+            column: topics[column].to_numpy().repeat(len(results))
+            for column in topics.columns
+        }
+        columns.update({column: results[column].to_numpy() for column in results.columns})
+        return DataFrame(columns)
+
+    def _save_checkpoint(
+        self,
+        queries: Sequence[Dict[str, Any]],
+        keys: Sequence[str],
+        restored: Sequence[Optional[DataFrame]],
+        results: Optional[DataFrame],
+    ) -> DataFrame:
+        # Save the new results per query and assemble all results in the order of the topics.
+        if self.checkpoint is None:
+            raise RuntimeError("No checkpoint configured.")
+        results_by_qid: Dict[Any, DataFrame] = {}
+        if results is not None:
+            results_by_qid = {
+                qid: query_results.reset_index(drop=True)
+                for qid, query_results in results.groupby("qid", sort=False, observed=True)
+            }
+        result_columns = list(self.result_columns)
+        assembled: List[DataFrame] = []
+        for row, key, query_results in zip(queries, keys, restored):
+            if query_results is None:
+                if results is None:
+                    raise RuntimeError("Missing results for query.")
+                query_results = results_by_qid.get(row["qid"], results.iloc[0:0])
+                # Only save the retrieved columns, as the topic's other columns might change until restored.
+                self.checkpoint.set(key, query_results[result_columns])
+            else:
+                query_results = self._merge_topic(row, query_results[result_columns])
+            assembled.append(query_results)
+        # Categories of different queries' results differ, so compact them again after concatenating.
+        return self._compact_results(concat(assembled, ignore_index=True))
+
+    def _transform_chunk(self, queries: Sequence[Dict[str, Any]], verbose: bool) -> DataFrame:
+        if self.checkpoint is None:
+            return self._transform_queries(queries, verbose)
+        keys, restored, pending = self._restore_checkpoint(queries)
+        results = self._transform_queries(pending, verbose) if len(pending) > 0 else None
+        return self._save_checkpoint(queries, keys, restored, results)
+
+    async def _atransform_chunk(self, queries: Sequence[Dict[str, Any]], verbose: bool) -> DataFrame:
+        if self.checkpoint is None:
+            return await self._atransform_queries(queries, verbose)
+        keys, restored, pending = await _run_blocking(self._restore_checkpoint, queries)
+        results = await self._atransform_queries(pending, verbose) if len(pending) > 0 else None
+        return await _run_blocking(self._save_checkpoint, queries, keys, restored, results)
+
+    def _checkpoint_chunks(self, queries: Sequence[Dict[str, Any]]) -> List[Sequence[Dict[str, Any]]]:
+        if self.checkpoint is None:
+            raise RuntimeError("No checkpoint configured.")
+        chunk_size = self.checkpoint.chunk_size
+        return [
+            queries[start:start + chunk_size]
+            for start in range(0, len(queries), chunk_size)
+        ]
 
-        if len(retrieved) == 0:
-            return retrieved
-        retrieved = retrieved.reset_index(drop=True)\
-            .sort_values(by=["score"], ascending=False)
-        retrieved = add_ranks(retrieved)
+    def _transform_checkpointed(self, queries: Sequence[Dict[str, Any]], verbose: bool) -> DataFrame:
+        # Search in chunks, so that the results of finished chunks are saved before continuing.
+        results: List[DataFrame] = []
+        with tqdm(
+            desc="Searching with ChatNoir",
+            unit="query",
+            total=len(queries),
+            disable=not verbose,
+        ) as progress:
+            for chunk in self._checkpoint_chunks(queries):
+                results.append(self._transform_chunk(chunk, verbose=False))
+                progress.update(len(chunk))
+        return self._compact_results(concat(results, ignore_index=True))
 
-        return retrieved
+    async def _atransform_checkpointed(self, queries: Sequence[Dict[str, Any]], verbose: bool) -> DataFrame:
+        results: List[DataFrame] = []
+        with tqdm(
+            desc="Searching with ChatNoir",
+            unit="query",
+            total=len(queries),
+            disable=not verbose,
+        ) as progress:
+            for chunk in self._checkpoint_chunks(queries):
+                results.append(await self._atransform_chunk(chunk, verbose=False))
+                progress.update(len(chunk))
+        return self._compact_results(concat(results, ignore_index=True))
+
+    def _shard_retriever(self) -> "ChatNoirRetrieve":
+        requests_per_second = self.requests_per_second
+        max_concurrency = self.max_concurrency
+        if self.backend != "thread":
+            # Each worker process has its own rate limiter, so split the rate limits among the shards.
+            if requests_per_second is not None:
+                requests_per_second = requests_per_second / self.n_shards
+            if max_concurrency is not None:
+                max_concurrency = max(1, max_concurrency // self.n_shards)
+        # Collect statistics in the shards, but only call the hooks once all shards are merged.
+        return replace(
+            self,
+            n_shards=1,
+            requests_per_second=requests_per_second,
+            max_concurrency=max_concurrency,
+            verbose=False,
+            collect_stats=self.stats.enabled,
+            stats_hooks=(),
+        )
+
+    def _transform_sharded(self, topics: DataFrame) -> DataFrame:
+        # Shard the topic rows, as each shard splits its own topics into queries.
+        shards = [
+            (self._shard_retriever(), topics.iloc[list(shard)])
+            for shard in _split_shards(range(len(topics)), self.n_shards)
+        ]
+        with self.stats.time("shards"):
+            sharded = _run_shards(_transform_shard, shards, self.backend)
+        for _, pages_fetched, stats in sharded:
+            self.pages_fetched.update(pages_fetched)
+            self.stats.merge(stats)
+        # The shards are contiguous, so their results are already in the topics' order.
+        return self._compact_results(concat([results for results, _, _ in sharded], ignore_index=True))
+
+    def transform(self, topics: DataFrame) -> DataFrame:
+        self._check_topics(topics)
+
+        if len(topics) == 0:
+            return self._transform_query(topics)
+
+        self.pages_fetched.clear()
+        self._start_stats()
+        with self.stats.time("transform"):
+            if self.n_shards > 1:
+                results = self._transform_sharded(topics)
+            else:
+                with self.stats.time("split"):
+                    queries = self._split_queries(topics)
+                if self.checkpoint is not None:
+                    results = self._transform_checkpointed(queries, verbose=self.verbose)
+                else:
+                    results = self._transform_queries(queries, verbose=self.verbose)
+        self.stats.finish()
+        return results
+
+    async def atransform(self, topics: DataFrame) -> DataFrame:
+        self._check_topics(topics)
+
+        if len(topics) == 0:
+            return self._transform_query(topics)
+
+        self.pages_fetched.clear()
+        self._start_stats()
+        with self.stats.time("transform"):
+            if self.n_shards > 1:
+                results = await get_running_loop().run_in_executor(None, self._transform_sharded, topics)
+            else:
+                with self.stats.time("split"):
+                    queries = self._split_queries(topics)
+                if self.checkpoint is not None:
+                    results = await self._atransform_checkpointed(queries, verbose=self.verbose)
+                else:
+                    results = await self._atransform_queries(queries, verbose=self.verbose)
+        self.stats.finish()
+        return results
+
+    async def asearch(self, query: str, qid: str = "1", sort: bool = True) -> DataFrame:
+        results = await self.atransform(DataFrame([[qid, query]], columns=["qid", "query"]))
+        if sort:
+            results = results.sort_values(["qid", "rank"], ascending=[True, True])
+        return results
+
+    def transform_iter(
+        self,
+        topics: DataFrame,
+        chunk_size: int = 100,
+    ) -> Iterator[DataFrame]:
+        self._check_topics(topics)
+
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive.")
+
+        self.pages_fetched.clear()
+        self._start_stats()
+        with tqdm(
+            desc="Searching with ChatNoir",
+            unit="query",
+            total=len(topics),
+            disable=not self.verbose,
+        ) as progress:
+            for start in range(0, len(topics), chunk_size):
+                # Only keep one chunk of queries and results in memory at a time.
+                with self.stats.time("split"):
+                    chunk = self._split_queries(topics.iloc[start:start + chunk_size])
+                yield self._transform_chunk(chunk, verbose=False)
+                progress.update(len(chunk))
+        self.stats.finish()
+
+    def transform_to_file(
+        self,
+        topics: DataFrame,
+        path: Union[str, Path],
+        format: Optional[ResultsFormat] = None,
+        chunk_size: int = 100,
+        run_name: str = "ChatNoir",
+    ) -> None:
+        write_results(
+            self.transform_iter(topics, chunk_size=chunk_size),
+            path=path,
+            format=format,
+            run_name=run_name,
+        )
+
+    def transform_to_arrow(
+        self,
+        topics: DataFrame,
+        chunk_size: int = 100,
+    ) -> "Table":
+        # Convert chunk by chunk, so that the full results are never held as a data frame.
+        return to_arrow(self.transform_iter(topics, chunk_size=chunk_size))
 
     def __hash__(self):
         return hash((
@@ -247,15 +1433,30 @@ class ChatNoirRetrieve(Transformer):
             ),
             self.phrases,
             self.slop,
-            (
-                list(sorted(self.features))
-                if isinstance(self.features, Set)
-                else self.features
-            ),
+            # Hash the combined flag, as sets of features cannot be sorted.
+            self._feature_plan.features,
             self.filter_unknown,
             self.num_results,
             self.page_size,
             self.retries,
             self.backoff_seconds,
             self.verbose,
+            self.fan_out,
+            (
+                tuple(sorted(self.num_results_per_index.items()))
+                if self.num_results_per_index is not None
+                else None
+            ),
+            self.fusion,
+            self.rrf_k,
+            self.compact,
         ))
+
+
+def _transform_shard(
+    shard: Tuple[ChatNoirRetrieve, DataFrame],
+) -> Tuple[DataFrame, Dict[Any, int], RetrievalStats]:
+    # Module-level, so that it can be sent to worker processes.
+    retrieve, topics = shard
+    results = retrieve.transform(topics)
+    return results, retrieve.pages_fetched, retrieve.stats
@@ -0,0 +1,786 @@
+import os
+from asyncio import (
+    AbstractEventLoop, FIRST_COMPLETED, Future as AsyncFuture, ensure_future, get_running_loop,
+    sleep as async_sleep, wait as async_wait,
+)
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext, asynccontextmanager
+from datetime import datetime
+from functools import partial
+from json import loads
+from logging import getLogger
+from os import getpid
+from random import uniform
+from threading import Event, Lock
+from time import sleep, monotonic
+from typing import (
+    Optional, Union, Set, Any, Dict, Mapping, ContextManager, AsyncContextManager, AsyncIterator, Tuple,
+    List, Callable, TypeVar,
+)
+from urllib.parse import urljoin
+from uuid import UUID
+from weakref import WeakKeyDictionary
+
+from chatnoir_api import Index, Slop, Results, Meta, Result, ExplainedResult
+from chatnoir_api.constants import BASE_URL
+from chatnoir_api.defaults import DEFAULT_TIMEOUT
+from chatnoir_api.model import SearchMethod, index_id, parse_index, decode_uuid
+from chatnoir_api.model.highlight import HighlightedText
+from chatnoir_api.v1.model import (
+    Request, PhraseRequest, SearchResponse, ExplainedSearchResponse, ResultResponse, MetaResponse,
+)
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from chatnoir_pyterrier.cassette import Cassette
+from chatnoir_pyterrier.hedge import HedgingPolicy
+from chatnoir_pyterrier.ratelimit import RateLimiter
+from chatnoir_pyterrier.stats import RetrievalStats, NULL_STATS
+
+_logger = getLogger("chatnoir-pyterrier")
+
+_T = TypeVar("_T")
+
+
+async def _run_blocking(function: Callable[..., _T], *args: Any) -> _T:
+    # Run blocking calls, e.g., to SQLite stores with their busy timeouts, without blocking the event loop.
+    return await get_running_loop().run_in_executor(None, partial(function, *args))
+
+
+@asynccontextmanager
+async def _async_nullcontext(value: Any = None) -> AsyncIterator[Any]:
+    # Python 3.8 and 3.9 do not support async with nullcontext().
+    yield value
+
+
+def _decode_result(result: Dict[str, Any]) -> ResultResponse:
+    # Same as ResultResponse.from_dict(result, infer_missing=True),
+    # without resolving the type hints again for every single result.
+    page_rank = result.get("page_rank")
+    spam_rank = result.get("spam_rank")
+    crawl_date = result.get("crawl_date")
+    return ResultResponse(
+        score=float(result["score"]),
+        uuid=decode_uuid(result["uuid"]),
+        target_uri=result.get("target_uri"),
+        snippet=HighlightedText(result["snippet"]),
+        index=parse_index(result["index"]),
+        title=HighlightedText(result["title"]),
+        trec_id=result.get("trec_id"),
+        target_hostname=result.get("target_hostname"),  # type: ignore[arg-type]
+        page_rank=float(page_rank) if page_rank is not None else None,
+        spam_rank=float(spam_rank) if spam_rank is not None else None,
+        warc_id=result.get("warc_id"),
+        cache_uri=result.get("cache_uri"),  # type: ignore[arg-type]
+        crawl_date=datetime.fromisoformat(crawl_date) if crawl_date is not None else None,
+        content_type=result.get("content_type"),
+        language=result.get("lang"),  # type: ignore[arg-type]
+    )
+
+
+def _decode_search_response(response: str) -> SearchResponse:
+    data: Dict[str, Any] = loads(response)
+    meta: Dict[str, Any] = data["meta"]
+    return SearchResponse(
+        _meta=MetaResponse(
+            indices={parse_index(index) for index in meta["indices"]},
+            query_time=meta.get("query_time"),  # type: ignore[arg-type]
+            total_results=meta.get("total_results"),  # type: ignore[arg-type]
+            search_method=meta.get("search_method"),  # type: ignore[arg-type]
+        ),
+        _results=tuple(_decode_result(result) for result in data["results"]),
+    )
+
+
+class ChatNoirHTTPError(RuntimeError):
+    status_code: int
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChatNoirSession:
+    base_url: str
+    pool_size: int
+    timeout: float
+    http2: bool
+    hedging: Optional[HedgingPolicy]
+
+    _client: Any
+    _pid: Optional[int]
+    _executor: Optional[ThreadPoolExecutor]
+    _executor_pid: Optional[int]
+    _async_clients: "WeakKeyDictionary[AbstractEventLoop, Any]"
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        pool_size: int = 10,
+        timeout: float = DEFAULT_TIMEOUT,
+        http2: bool = False,
+        hedging: Optional[HedgingPolicy] = None,
+    ):
+        if pool_size < 1:
+            raise ValueError("Pool size must be positive.")
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.http2 = http2
+        self.hedging = hedging
+        self._client = None
+        self._pid = None
+        self._executor = None
+        self._executor_pid = None
+        self._async_clients = WeakKeyDictionary()
+
+    def _create_client(self) -> Any:
+        if self.http2:
+            from httpx import Client, Limits
+            try:
+                return Client(
+                    http2=True,
+                    limits=Limits(
+                        max_connections=self.pool_size,
+                        max_keepalive_connections=self.pool_size,
+                    ),
+                )
+            except ImportError:
+                raise ImportError(
+                    "HTTP/2 requires the h2 package. "
+                    "Install it with: pip install chatnoir-pyterrier[http2]"
+                )
+        session = Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @property
+    def client(self) -> Any:
+        # Connections cannot be shared with forked processes (e.g., Ray or multiprocessing workers),
+        # so create a new connection pool in each process.
+        pid = getpid()
+        if self._pid != pid:
+            self._client = self._create_client()
+            self._pid = pid
+        return self._client
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Threads do not survive forking either, so create new ones in each process.
+        pid = getpid()
+        executor = self._executor
+        if executor is None or self._executor_pid != pid:
+            executor = self._executor = ThreadPoolExecutor(
+                max_workers=self.hedging.max_workers if self.hedging is not None else 1,
+                thread_name_prefix="chatnoir-hedge",
+            )
+            self._executor_pid = pid
+        return executor
+
+    def close(self) -> None:
+        if self._client is not None and self._pid == getpid():
+            self._client.close()
+        self._client = None
+        self._pid = None
+        if self._executor is not None and self._executor_pid == getpid():
+            self._executor.shutdown(wait=False)
+        self._executor = None
+        self._executor_pid = None
+
+    async def aclose(self) -> None:
+        client = self._async_clients.pop(get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+    ) -> Any:
+        if self.http2:
+            return self.client.request(
+                method, url, headers=headers, params=params, content=data, timeout=self.timeout,
+            )
+        return self.client.request(
+            method, url, headers=headers, params=params, data=data, timeout=self.timeout,
+        )
+
+    @staticmethod
+    def _check_status(status_code: int, text: str) -> None:
+        if status_code == 429:
+            raise ChatNoirHTTPError(
+                "ChatNoir API quota exceeded. Please throttle requests.",
+                status_code,
+            )
+        elif status_code // 100 == 5:
+            raise ChatNoirHTTPError(
+                "ChatNoir API internal server error. "
+                "Please get in contact with the admins.",
+                status_code,
+            )
+        elif status_code == 401:
+            raise ChatNoirHTTPError(
+                "ChatNoir API key invalid or missing.",
+                status_code,
+            )
+        elif status_code == 403:
+            raise ChatNoirHTTPError(
+                "ChatNoir API blocked this IP address. "
+                "Please get in contact with the admins.",
+                status_code,
+            )
+        elif status_code // 100 != 2:
+            raise ChatNoirHTTPError(
+                f"ChatNoir API request failed "
+                f"with code {status_code}. "
+                f"Please get in contact with the admins.\n{text}",
+                status_code,
+            )
+
+    @staticmethod
+    def _should_retry(error: ChatNoirHTTPError, retries: int) -> bool:
+        retryable = error.status_code == 429 or error.status_code // 100 == 5
+        return retryable and retries > 0
+
+    @staticmethod
+    def _next_backoff_seconds(backoff_seconds: float) -> float:
+        # The jitter must not make small backoffs negative.
+        return max(0.0, round(backoff_seconds) * 2 + uniform(-0.5, 0.5))  # nosec: B311
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        headers: Optional[Mapping[str, str]] = None,
+        params: Optional[Mapping[str, str]] = None,
+        data: Optional[bytes] = None,
+        retries: int = 0,
+        backoff_seconds: float = 0,
+        rate_limiter: Optional[RateLimiter] = None,
+        stats: RetrievalStats = NULL_STATS,
+        cassette: Optional[Cassette] = None,
+    ) -> str:
+        key: Optional[str] = None
+        if cassette is not None:
+            key = cassette.key(method, path, params, data)
+            recorded = cassette.lookup(key, f"{method} {path}")
+            if recorded is not None:
+                stats.count("replayed")
+                return recorded
+        response = self._request(
+            method, path, headers, params, data, retries, backoff_seconds, rate_limiter, stats,
+        )
+        if cassette is not None and key is not None:
+            cassette.record(key, response)
+            stats.count("recorded")
+        return response
+
+    def _send_checked(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+        kind: str,
+    ) -> str:
+        start = monotonic()
+        response = self._send(method, url, headers, params, data)
+        self._check_status(response.status_code, response.text)
+        if self.hedging is not None:
+            self.hedging.record(kind, monotonic() - start)
+        return response.text
+
+    def _send_duplicate(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+        kind: str,
+        rate_limiter: Optional[RateLimiter],
+        stats: RetrievalStats,
+    ) -> Optional[str]:
+        # Duplicate requests count towards the rate limits, too, but never wait for a concurrency slot,
+        # as the slot might only be freed by the request they duplicate.
+        limit: ContextManager[bool] = rate_limiter.try_request() \
+            if rate_limiter is not None else nullcontext(True)
+        with limit as acquired:
+            if not acquired or self.hedging is None or not self.hedging.fire():
+                return None
+            stats.count("hedges_fired")
+            stats.count("requests")
+            return self._send_checked(method, url, headers, params, data, kind)
+
+    def _send_hedged(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+        kind: str,
+        rate_limiter: Optional[RateLimiter],
+        stats: RetrievalStats,
+    ) -> str:
+        hedging = self.hedging
+        delay = hedging.delay(kind) if hedging is not None else None
+        if hedging is None or delay is None or not hedging.can_fire():
+            # Without a possible duplicate, send on the calling thread.
+            return self._send_checked(method, url, headers, params, data, kind)
+
+        # Send a duplicate request if the first one is slower than usual, and take whichever answers first.
+        # The slower request cannot be cancelled, but its response is ignored.
+        started = Event()
+
+        def send_primary() -> Optional[str]:
+            started.set()
+            return self._send_checked(method, url, headers, params, data, kind)
+
+        primary = self.executor.submit(send_primary)
+        pending = {primary}
+        # Only start the clock once the request is sent, so that waiting for a thread never fires a duplicate.
+        started.wait()
+        done, _ = wait(pending, timeout=delay)
+        if len(done) == 0 and hedging.can_fire():
+            pending.add(self.executor.submit(
+                self._send_duplicate, method, url, headers, params, data, kind, rate_limiter, stats,
+            ))
+        errors: List[BaseException] = []
+        try:
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    error = future.exception()
+                    if error is not None:
+                        errors.append(error)
+                        continue
+                    response: Optional[str] = future.result()
+                    if response is None:
+                        # The duplicate was not sent.
+                        continue
+                    if future is not primary:
+                        hedging.won()
+                        stats.count("hedges_won")
+                    return response
+            raise errors[0]
+        finally:
+            # Do not send a duplicate that is still waiting for a thread.
+            for future in pending:
+                future.cancel()
+
+    async def _asend_checked(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+        kind: str,
+    ) -> str:
+        start = monotonic()
+        response = await self._async_client().request(
+            method, url, headers=headers, params=params, content=data, timeout=self.timeout,
+        )
+        self._check_status(response.status_code, response.text)
+        if self.hedging is not None:
+            self.hedging.record(kind, monotonic() - start)
+        return response.text
+
+    async def _asend_duplicate(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+        kind: str,
+        rate_limiter: Optional[RateLimiter],
+        stats: RetrievalStats,
+    ) -> Optional[str]:
+        limit: AsyncContextManager[bool] = rate_limiter.atry_request() \
+            if rate_limiter is not None else _async_nullcontext(True)
+        async with limit as acquired:
+            if not acquired or self.hedging is None or not self.hedging.fire():
+                return None
+            stats.count("hedges_fired")
+            stats.count("requests")
+            return await self._asend_checked(method, url, headers, params, data, kind)
+
+    async def _asend_hedged(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+        kind: str,
+        rate_limiter: Optional[RateLimiter],
+        stats: RetrievalStats,
+    ) -> str:
+        hedging = self.hedging
+        delay = hedging.delay(kind) if hedging is not None else None
+        if hedging is None or delay is None or not hedging.can_fire():
+            return await self._asend_checked(method, url, headers, params, data, kind)
+
+        primary: "AsyncFuture[Optional[str]]" = ensure_future(
+            self._asend_checked(method, url, headers, params, data, kind),
+        )
+        pending: Set["AsyncFuture[Optional[str]]"] = {primary}
+        try:
+            done, _ = await async_wait(pending, timeout=delay)
+            if len(done) == 0 and hedging.can_fire():
+                pending.add(ensure_future(self._asend_duplicate(
+                    method, url, headers, params, data, kind, rate_limiter, stats,
+                )))
+            errors: List[BaseException] = []
+            while len(pending) > 0:
+                done, pending = await async_wait(pending, return_when=FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is not None:
+                        errors.append(error)
+                        continue
+                    response = task.result()
+                    if response is None:
+                        # The duplicate was not sent.
+                        continue
+                    if task is not primary:
+                        hedging.won()
+                        stats.count("hedges_won")
+                    return response
+            raise errors[0]
+        finally:
+            # Unlike threads, the slower request can be cancelled.
+            for task in pending:
+                task.cancel()
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+        retries: int,
+        backoff_seconds: float,
+        rate_limiter: Optional[RateLimiter],
+        stats: RetrievalStats,
+    ) -> str:
+        url = urljoin(self.base_url, path)
+        while True:
+            limit: ContextManager[None] = rate_limiter.request() \
+                if rate_limiter is not None else nullcontext()
+            try:
+                with limit:
+                    stats.count("requests")
+                    return self._send_hedged(method, url, headers, params, data, path, rate_limiter, stats)
+            except ChatNoirHTTPError as error:
+                stats.count("http_errors")
+                if not self._should_retry(error, retries):
+                    raise
+                stats.count("retries")
+                _logger.warning(f"{error} Retrying in {round(backoff_seconds)} seconds.")
+            sleep(backoff_seconds)
+            retries -= 1
+            backoff_seconds = self._next_backoff_seconds(backoff_seconds)
+
+    def _async_client(self) -> Any:
+        # Async connections are bound to the event loop that opened them.
+        loop = get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from httpx import AsyncClient, Limits
+            client = AsyncClient(
+                http2=self.http2,
+                limits=Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def arequest(
+        self,
+        method: str,
+        path: str,
+        headers: Optional[Mapping[str, str]] = None,
+        params: Optional[Mapping[str, str]] = None,
+        data: Optional[bytes] = None,
+        retries: int = 0,
+        backoff_seconds: float = 0,
+        rate_limiter: Optional[RateLimiter] = None,
+        stats: RetrievalStats = NULL_STATS,
+        cassette: Optional[Cassette] = None,
+    ) -> str:
+        key: Optional[str] = None
+        if cassette is not None:
+            key = cassette.key(method, path, params, data)
+            recorded = await _run_blocking(cassette.lookup, key, f"{method} {path}")
+            if recorded is not None:
+                stats.count("replayed")
+                return recorded
+        response = await self._arequest(
+            method, path, headers, params, data, retries, backoff_seconds, rate_limiter, stats,
+        )
+        if cassette is not None and key is not None:
+            await _run_blocking(cassette.record, key, response)
+            stats.count("recorded")
+        return response
+
+    async def _arequest(
+        self,
+        method: str,
+        path: str,
+        headers: Optional[Mapping[str, str]],
+        params: Optional[Mapping[str, str]],
+        data: Optional[bytes],
+        retries: int,
+        backoff_seconds: float,
+        rate_limiter: Optional[RateLimiter],
+        stats: RetrievalStats,
+    ) -> str:
+        url = urljoin(self.base_url, path)
+        while True:
+            limit: AsyncContextManager[None] = rate_limiter.arequest() \
+                if rate_limiter is not None else _async_nullcontext()
+            try:
+                async with limit:
+                    stats.count("requests")
+                    return await self._asend_hedged(
+                        method, url, headers, params, data, path, rate_limiter, stats,
+                    )
+            except ChatNoirHTTPError as error:
+                stats.count("http_errors")
+                if not self._should_retry(error, retries):
+                    raise
+                stats.count("retries")
+                _logger.warning(f"{error} Retrying in {round(backoff_seconds)} seconds.")
+            await async_sleep(backoff_seconds)
+            retries -= 1
+            backoff_seconds = self._next_backoff_seconds(backoff_seconds)
+
+    @staticmethod
+    def _search_request(
+        query: str,
+        index: Union[Index, Set[Index]],
+        phrases: bool,
+        slop: Slop,
+        explain: bool,
+        start: int,
+        size: int,
+        api_key: str,
+        search_method: SearchMethod,
+    ) -> Tuple[str, Dict[str, str], bytes]:
+        index_set: Set[Index] = index if isinstance(index, Set) else {index}
+        request: Request
+        if phrases:
+            request = PhraseRequest(
+                apikey=api_key,
+                query=query,
+                index=index_set,
+                start=start,
+                size=size,
+                explain=explain,
+                minimal=False,
+                extended_meta=False,
+                search_method=search_method,
+                slop=slop,
+            )
+        else:
+            request = Request(
+                apikey=api_key,
+                query=query,
+                index=index_set,
+                start=start,
+                size=size,
+                explain=explain,
+                minimal=False,
+                extended_meta=False,
+                search_method=search_method,
+            )
+        path = f"api/v1/{'_phrases' if phrases else '_search'}"
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "text/plain",
+        }
+        return path, headers, request.to_json().encode("utf-8")
+
+    @staticmethod
+    def _search_response(
+        response: str,
+        explain: bool,
+    ) -> Results[Meta, Union[Result, ExplainedResult]]:
+        if explain:
+            # Explanations are nested and rarely requested, so use the generic decoder.
+            return ExplainedSearchResponse.from_json(response, infer_missing=True)  # type: ignore
+        return _decode_search_response(response)  # type: ignore
+
+    @staticmethod
+    def _cache_params(uuid: UUID, index: Index, plain: bool) -> Dict[str, str]:
+        return {
+            "uuid": str(uuid),
+            "index": index_id(index),
+            "raw": "true",
+            "plain": "true" if plain else "false",
+        }
+
+    def search_page(
+        self,
+        query: str,
+        index: Union[Index, Set[Index]],
+        phrases: bool,
+        slop: Slop,
+        explain: bool,
+        start: int,
+        size: int,
+        api_key: str,
+        search_method: SearchMethod,
+        retries: int = 0,
+        backoff_seconds: float = 0,
+        rate_limiter: Optional[RateLimiter] = None,
+        stats: RetrievalStats = NULL_STATS,
+        cassette: Optional[Cassette] = None,
+    ) -> Results[Meta, Union[Result, ExplainedResult]]:
+        path, headers, data = self._search_request(
+            query, index, phrases, slop, explain, start, size, api_key, search_method,
+        )
+        response = self.request(
+            "POST",
+            path,
+            headers=headers,
+            data=data,
+            retries=retries,
+            backoff_seconds=backoff_seconds,
+            rate_limiter=rate_limiter,
+            stats=stats,
+            cassette=cassette,
+        )
+        return self._search_response(response, explain)
+
+    async def asearch_page(
+        self,
+        query: str,
+        index: Union[Index, Set[Index]],
+        phrases: bool,
+        slop: Slop,
+        explain: bool,
+        start: int,
+        size: int,
+        api_key: str,
+        search_method: SearchMethod,
+        retries: int = 0,
+        backoff_seconds: float = 0,
+        rate_limiter: Optional[RateLimiter] = None,
+        stats: RetrievalStats = NULL_STATS,
+        cassette: Optional[Cassette] = None,
+    ) -> Results[Meta, Union[Result, ExplainedResult]]:
+        path, headers, data = self._search_request(
+            query, index, phrases, slop, explain, start, size, api_key, search_method,
+        )
+        response = await self.arequest(
+            "POST",
+            path,
+            headers=headers,
+            data=data,
+            retries=retries,
+            backoff_seconds=backoff_seconds,
+            rate_limiter=rate_limiter,
+            stats=stats,
+            cassette=cassette,
+        )
+        return self._search_response(response, explain)
+
+    def cache_contents(
+        self,
+        uuid: UUID,
+        index: Index,
+        plain: bool,
+        retries: int = 0,
+        backoff_seconds: float = 0,
+        rate_limiter: Optional[RateLimiter] = None,
+        stats: RetrievalStats = NULL_STATS,
+        cassette: Optional[Cassette] = None,
+    ) -> str:
+        return self.request(
+            "GET",
+            "cache",
+            params=self._cache_params(uuid, index, plain),
+            retries=retries,
+            backoff_seconds=backoff_seconds,
+            rate_limiter=rate_limiter,
+            stats=stats,
+            cassette=cassette,
+        )
+
+    async def acache_contents(
+        self,
+        uuid: UUID,
+        index: Index,
+        plain: bool,
+        retries: int = 0,
+        backoff_seconds: float = 0,
+        rate_limiter: Optional[RateLimiter] = None,
+        stats: RetrievalStats = NULL_STATS,
+        cassette: Optional[Cassette] = None,
+    ) -> str:
+        return await self.arequest(
+            "GET",
+            "cache",
+            params=self._cache_params(uuid, index, plain),
+            retries=retries,
+            backoff_seconds=backoff_seconds,
+            rate_limiter=rate_limiter,
+            stats=stats,
+            cassette=cassette,
+        )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Connections cannot be pickled, e.g., when sending to Ray workers.
+        state = self.__dict__.copy()
+        state["_client"] = None
+        state["_pid"] = None
+        state["_executor"] = None
+        state["_executor_pid"] = None
+        del state["_async_clients"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._async_clients = WeakKeyDictionary()
+
+    def __repr__(self) -> str:
+        return f"ChatNoirSession({self.base_url!r}, pool_size={self.pool_size!r}, http2={self.http2!r})"
+
+
+_default_session: Optional[ChatNoirSession] = None
+_default_session_lock = Lock()
+
+
+def default_session() -> ChatNoirSession:
+    # Transformers without an explicit session share one connection pool in each process.
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = ChatNoirSession()
+        return _default_session
+
+
+def _reset_default_session_lock() -> None:
+    # The lock might be held by another thread while forking.
+    global _default_session_lock
+    _default_session_lock = Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_default_session_lock)
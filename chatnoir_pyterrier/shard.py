@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, List, Sequence, TypeVar
+
+from typing_extensions import Literal, TypeAlias
+
+ShardBackend: TypeAlias = Literal["thread", "process", "ray"]
+
+_T = TypeVar("_T")
+_U = TypeVar("_U")
+
+
+def _split_shards(items: Sequence[_T], n_shards: int) -> List[Sequence[_T]]:
+    # Split into contiguous shards of (almost) equal size, so that concatenating
+    # the shards' results keeps the items' order.
+    size, remainder = divmod(len(items), n_shards)
+    shards: List[Sequence[_T]] = []
+    start = 0
+    for shard in range(n_shards):
+        end = start + size + (1 if shard < remainder else 0)
+        if end > start:
+            shards.append(items[start:end])
+        start = end
+    return shards
+
+
+def _run_shards(
+    function: Callable[[_T], _U],
+    shards: Sequence[_T],
+    backend: ShardBackend,
+) -> List[_U]:
+    if backend == "thread":
+        with ThreadPoolExecutor(
+            max_workers=len(shards),
+            thread_name_prefix="chatnoir-shard",
+        ) as executor:
+            return list(executor.map(function, shards))
+    elif backend == "process":
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            return list(executor.map(function, shards))
+    elif backend == "ray":
+        try:
+            from ray import remote, get
+        except ImportError:
+            raise ImportError(
+                "Sharding with Ray requires Ray. "
+                "Install it with: pip install chatnoir-pyterrier[ray]"
+            )
+        remote_function = remote(function)
+        return get([remote_function.remote(shard) for shard in shards])
+    else:
+        raise ValueError(f"Unknown shard backend: {backend}")
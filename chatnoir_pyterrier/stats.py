@@ -0,0 +1,233 @@
+from contextlib import contextmanager, nullcontext, ExitStack
+from dataclasses import dataclass
+from logging import Logger, getLogger, INFO
+from os import replace
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Optional, Iterator, Dict, List, Sequence, Any, ContextManager, Union
+
+from numpy import percentile
+
+_logger = getLogger("chatnoir-pyterrier")
+
+
+@dataclass(frozen=True)
+class LatencySummary:
+    count: int
+    total_seconds: float
+    max_seconds: float
+    p50_seconds: float
+    p95_seconds: float
+    p99_seconds: float
+
+    @property
+    def mean_seconds(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return self.total_seconds / self.count
+
+
+class StatsHook:
+    def span(self, stage: str) -> ContextManager[Any]:
+        # Called around each timed stage, e.g., to trace it.
+        return nullcontext()
+
+    def finished(self, stats: "RetrievalStats") -> None:
+        # Called after each transform with the collected statistics.
+        pass
+
+
+class RetrievalStats:
+    enabled: bool = True
+    hooks: Sequence[StatsHook]
+
+    _lock: Lock
+    _counters: Dict[str, int]
+    _latencies: Dict[str, List[float]]
+
+    def __init__(self, hooks: Sequence[StatsHook] = ()):
+        self.hooks = hooks
+        self._lock = Lock()
+        self._counters = {}
+        self._latencies = {}
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def _time(self, stage: str) -> Iterator[None]:
+        with ExitStack() as stack:
+            for hook in self.hooks:
+                stack.enter_context(hook.span(stage))
+            start = perf_counter()
+            try:
+                yield
+            finally:
+                self.record(stage, perf_counter() - start)
+
+    def time(self, stage: str) -> ContextManager[None]:
+        return self._time(stage)
+
+    def merge(self, other: "RetrievalStats") -> None:
+        # Add the counters and latencies collected elsewhere, e.g., in a worker process.
+        counters = other.counters
+        with other._lock:
+            latencies = {stage: list(samples) for stage, samples in other._latencies.items()}
+        with self._lock:
+            for name, value in counters.items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            for stage, samples in latencies.items():
+                self._latencies.setdefault(stage, []).extend(samples)
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def latency(self, stage: str) -> LatencySummary:
+        with self._lock:
+            samples = list(self._latencies.get(stage, ()))
+        if len(samples) == 0:
+            return LatencySummary(0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        p50, p95, p99 = percentile(samples, [50, 95, 99])
+        return LatencySummary(
+            count=len(samples),
+            total_seconds=sum(samples),
+            max_seconds=max(samples),
+            p50_seconds=float(p50),
+            p95_seconds=float(p95),
+            p99_seconds=float(p99),
+        )
+
+    @property
+    def latencies(self) -> Dict[str, LatencySummary]:
+        with self._lock:
+            stages = list(self._latencies.keys())
+        return {stage: self.latency(stage) for stage in stages}
+
+    def to_prometheus(self, prefix: str = "chatnoir") -> str:
+        lines: List[str] = []
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        latencies = self.latencies
+        if len(latencies) > 0:
+            lines.append(f"# TYPE {prefix}_stage_seconds summary")
+        for stage, summary in sorted(latencies.items()):
+            for quantile, seconds in (
+                ("0.5", summary.p50_seconds),
+                ("0.95", summary.p95_seconds),
+                ("0.99", summary.p99_seconds),
+            ):
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {seconds}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {summary.total_seconds}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {summary.count}')
+        return "".join(f"{line}\n" for line in lines)
+
+    def finish(self) -> None:
+        for hook in self.hooks:
+            hook.finished(self)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Locks cannot be pickled, e.g., when sending to Ray workers.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        return f"RetrievalStats(counters={self.counters!r})"
+
+
+class _NullStats(RetrievalStats):
+    # Collects nothing, so that instrumentation is almost free when disabled.
+    enabled = False
+
+    _null_context: ContextManager[None] = nullcontext()
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def record(self, stage: str, seconds: float) -> None:
+        pass
+
+    def time(self, stage: str) -> ContextManager[None]:
+        return self._null_context
+
+    def merge(self, other: RetrievalStats) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+NULL_STATS: RetrievalStats = _NullStats()
+
+
+class LoggingStatsHook(StatsHook):
+    logger: Logger
+    level: int
+
+    def __init__(self, logger: Optional[Logger] = None, level: int = INFO):
+        self.logger = logger if logger is not None else _logger
+        self.level = level
+
+    def finished(self, stats: RetrievalStats) -> None:
+        counters = ", ".join(
+            f"{name}={value}"
+            for name, value in sorted(stats.counters.items())
+        )
+        self.logger.log(self.level, f"ChatNoir counters: {counters}")
+        for stage, summary in sorted(stats.latencies.items()):
+            self.logger.log(
+                self.level,
+                f"ChatNoir {stage}: {summary.count} times, "
+                f"p50={summary.p50_seconds:.3f}s, "
+                f"p95={summary.p95_seconds:.3f}s, "
+                f"p99={summary.p99_seconds:.3f}s, "
+                f"max={summary.max_seconds:.3f}s",
+            )
+
+
+class PrometheusStatsHook(StatsHook):
+    path: Path
+    prefix: str
+
+    def __init__(self, path: Union[str, Path], prefix: str = "chatnoir"):
+        self.path = Path(path)
+        self.prefix = prefix
+
+    def finished(self, stats: RetrievalStats) -> None:
+        # Replace the file atomically, so that collectors never read a partial file.
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_name(f".{self.path.name}.tmp")
+        temporary_path.write_text(stats.to_prometheus(self.prefix))
+        replace(temporary_path, self.path)
+
+
+class OpenTelemetryStatsHook(StatsHook):
+    tracer: Any
+
+    def __init__(self, tracer: Any = None):
+        if tracer is None:
+            try:
+                from opentelemetry.trace import get_tracer
+            except ImportError:
+                raise ImportError(
+                    "Tracing requires OpenTelemetry. "
+                    "Install it with: pip install chatnoir-pyterrier[opentelemetry]"
+                )
+            tracer = get_tracer("chatnoir-pyterrier")
+        self.tracer = tracer
+
+    def span(self, stage: str) -> ContextManager[Any]:
+        return self.tracer.start_as_current_span(f"chatnoir.{stage}")
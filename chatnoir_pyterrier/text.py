@@ -0,0 +1,133 @@
+from dataclasses import dataclass, field, replace
+from typing import Optional, Any, Dict, List, Tuple, Set
+from uuid import UUID, uuid5, NAMESPACE_URL
+
+from chatnoir_api import Index
+from chatnoir_api.model import index_prefix
+from pandas import DataFrame, isna
+from pyterrier import Transformer
+
+from chatnoir_pyterrier.feature import Feature
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, _ContentsKey
+from chatnoir_pyterrier.stats import RetrievalStats, NULL_STATS
+
+# Document to fetch the contents of: UUID, index, and document number for the content cache.
+_Document = Tuple[UUID, Index, str]
+
+
+@dataclass
+class ChatNoirText(Transformer):
+    name = "ChatNoirText"
+
+    retrieve: ChatNoirRetrieve = field(default_factory=ChatNoirRetrieve)
+    features: Feature = Feature.CONTENTS_PLAIN
+    stats: RetrievalStats = field(
+        default_factory=lambda: NULL_STATS,
+        init=False,
+        repr=False,
+        compare=False,
+    )
+
+    def __post_init__(self):
+        if self.features == Feature.NONE or \
+                self.features & ~(Feature.CONTENTS | Feature.CONTENTS_PLAIN) != Feature.NONE:
+            raise ValueError("Features must be contents, plain text contents, or both.")
+
+    def _index(self, docno: Any) -> Index:
+        indices = sorted(self.retrieve.index) if isinstance(self.retrieve.index, Set) else [self.retrieve.index]
+        if len(indices) > 1 and not isna(docno):
+            # TREC IDs of some indices, e.g., ClueWeb, tell from which index a document is.
+            indices = [index for index in indices if str(docno).startswith(f"{index_prefix(index)}-")]
+        if len(indices) != 1:
+            raise RuntimeError("Needs an index column to fetch contents from multiple indices.")
+        return indices[0]
+
+    def _document(self, docno: Any, uuid: Any, index: Any) -> Optional[_Document]:
+        if isna(index):
+            index = self._index(docno)
+        if not isna(uuid):
+            uuid = uuid if isinstance(uuid, UUID) else UUID(str(uuid))
+        elif not isna(docno):
+            # ChatNoir derives the UUIDs from the TREC IDs.
+            uuid = uuid5(NAMESPACE_URL, f"{index_prefix(index)}:{docno}")
+        else:
+            return None
+        # Fall back to the UUID if the TREC ID is unknown, like ChatNoirRetrieve.
+        return uuid, index, str(docno) if not isna(docno) else str(uuid)
+
+    def _documents(self, inp: DataFrame) -> List[Optional[_Document]]:
+        if "docno" not in inp.columns and "uuid" not in inp.columns:
+            raise RuntimeError("Needs docno or uuid column.")
+        none: List[Any] = [None] * len(inp)
+        return [
+            self._document(docno, uuid, index)
+            for docno, uuid, index in zip(
+                inp["docno"] if "docno" in inp.columns else none,
+                inp["uuid"] if "uuid" in inp.columns else none,
+                inp["index"] if "index" in inp.columns else none,
+            )
+        ]
+
+    def _contents_keys(self, documents: List[Optional[_Document]]) -> List[Tuple[_ContentsKey, str]]:
+        # Fetch each document only once, even if retrieved for multiple queries.
+        docnos: Dict[_ContentsKey, str] = {}
+        for document in documents:
+            if document is None:
+                continue
+            uuid, index, docno = document
+            if Feature.CONTENTS in self.features:
+                docnos[(uuid, index, False)] = docno
+            if Feature.CONTENTS_PLAIN in self.features:
+                docnos[(uuid, index, True)] = docno
+        return list(docnos.items())
+
+    def _add_contents(
+        self,
+        inp: DataFrame,
+        documents: List[Optional[_Document]],
+        contents: Dict[_ContentsKey, Optional[str]],
+    ) -> DataFrame:
+        columns: Dict[str, List[Optional[str]]] = {}
+        for column, plain, feature in (
+            ("contents", False, Feature.CONTENTS),
+            ("text", True, Feature.CONTENTS_PLAIN),
+            ("contents_plain", True, Feature.CONTENTS_PLAIN),
+        ):
+            if feature not in self.features:
+                continue
+            columns[column] = [
+                contents.get((document[0], document[1], plain)) if document is not None else None
+                for document in documents
+            ]
+        return inp.assign(**columns)
+
+    def _fetcher(self) -> ChatNoirRetrieve:
+        # Collect separate statistics, without resetting those of the (possibly same) retriever.
+        fetcher = replace(self.retrieve)
+        fetcher._start_stats()
+        self.stats = fetcher.stats
+        return fetcher
+
+    def transform(self, inp: DataFrame) -> DataFrame:
+        fetcher = self._fetcher()
+        with fetcher.stats.time("text"):
+            documents = self._documents(inp)
+            contents = fetcher._fetch_contents_by_key(
+                self._contents_keys(documents),
+                verbose=fetcher.verbose,
+            )
+            result = fetcher._compact_results(self._add_contents(inp, documents, contents))
+        fetcher.stats.finish()
+        return result
+
+    async def atransform(self, inp: DataFrame) -> DataFrame:
+        fetcher = self._fetcher()
+        with fetcher.stats.time("text"):
+            documents = self._documents(inp)
+            contents = await fetcher._afetch_contents_by_key(
+                self._contents_keys(documents),
+                verbose=fetcher.verbose,
+            )
+            result = fetcher._compact_results(self._add_contents(inp, documents, contents))
+        fetcher.stats.finish()
+        return result
@@ -1,10 +1,12 @@
 from os import environ
+from typing import Iterator
 
 from pytest import fixture
 # from pytest import fixture, skip
 
 from chatnoir_api import Index
 
+from chatnoir_pyterrier.mock import MockChatNoirServer
 from chatnoir_pyterrier.retrieve import Feature
 
 
@@ -43,3 +45,9 @@ def index(request) -> Index:
 @fixture(scope="module", params=[feature for feature in Feature])
 def feature(request) -> Feature:
     return request.param
+
+
+@fixture(scope="module")
+def mock_server() -> Iterator[MockChatNoirServer]:
+    with MockChatNoirServer(total_results=100, max_page_size=50, document_size=1_000) as server:
+        yield server
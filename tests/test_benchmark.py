@@ -0,0 +1,113 @@
+from tracemalloc import start, stop, get_traced_memory
+from typing import Callable, Any, Iterator
+
+from pandas import DataFrame
+from pytest import importorskip, mark, fixture
+
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, Feature
+
+# Install the benchmark dependencies with: pip install chatnoir-pyterrier[benchmarks]
+importorskip("pytest_benchmark")
+
+# Upper bounds for the peak memory (about 3x the measured peaks), to catch memory regressions.
+_MAX_PEAK_MEMORY_TOPICS = 8 * 1024 * 1024
+_MAX_PEAK_MEMORY_ALL_FEATURES = 64 * 1024 * 1024
+
+
+def _topics(num_topics: int) -> DataFrame:
+    return DataFrame({
+        "qid": [str(i) for i in range(num_topics)],
+        "query": [f"query {i}" for i in range(num_topics)],
+    })
+
+
+def _peak_memory(function: Callable[[], Any]) -> int:
+    start()
+    try:
+        function()
+        _, peak = get_traced_memory()
+    finally:
+        stop()
+    return peak
+
+
+@fixture(scope="module")
+def benchmark_server() -> Iterator[MockChatNoirServer]:
+    with MockChatNoirServer(total_results=1000, max_page_size=1000, unknown_rate=0) as server:
+        yield server
+
+
+@mark.parametrize("num_topics", [1, 100, 10_000])
+def test_benchmark_topics(benchmark, benchmark_server: MockChatNoirServer, num_topics: int):
+    topics = _topics(num_topics)
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=benchmark_server.session(),
+        max_workers=8,
+    )
+    result = benchmark.pedantic(
+        retrieve.transform,
+        args=(topics,),
+        rounds=1 if num_topics > 100 else 5,
+    )
+    assert len(result) == num_topics * 10
+    peak_memory = _peak_memory(lambda: retrieve.transform(topics.head(100)))
+    benchmark.extra_info["peak_memory_bytes"] = peak_memory
+    assert peak_memory < _MAX_PEAK_MEMORY_TOPICS
+
+
+def test_benchmark_features(benchmark, benchmark_server: MockChatNoirServer, feature: Feature):
+    topics = _topics(10)
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=benchmark_server.session(),
+        features=feature,
+        num_results=100,
+    )
+    result = benchmark(retrieve.transform, topics)
+    assert len(result) == 1000
+
+
+def test_benchmark_all_features(benchmark, benchmark_server: MockChatNoirServer):
+    topics = _topics(10)
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=benchmark_server.session(),
+        features=Feature.ALL,
+        num_results=100,
+    )
+    result = benchmark(retrieve.transform, topics)
+    assert len(result) == 1000
+    peak_memory = _peak_memory(lambda: retrieve.transform(topics))
+    benchmark.extra_info["peak_memory_bytes"] = peak_memory
+    assert peak_memory < _MAX_PEAK_MEMORY_ALL_FEATURES
+
+
+@mark.parametrize("phrases", [False, True])
+def test_benchmark_phrases(benchmark, benchmark_server: MockChatNoirServer, phrases: bool):
+    topics = _topics(10)
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=benchmark_server.session(),
+        phrases=phrases,
+        num_results=100,
+    )
+    result = benchmark(retrieve.transform, topics)
+    assert len(result) == 1000
+
+
+@mark.parametrize("document_size", [1_000, 100_000])
+@mark.parametrize("max_content_workers", [1, 8])
+def test_benchmark_contents(benchmark, document_size: int, max_content_workers: int):
+    topics = _topics(10)
+    with MockChatNoirServer(document_size=document_size, latency_seconds=0.001) as server:
+        retrieve = ChatNoirRetrieve(
+            api_key="test",
+            session=server.session(),
+            features=Feature.CONTENTS_PLAIN,
+            max_content_workers=max_content_workers,
+        )
+        result = benchmark.pedantic(retrieve.transform, args=(topics,), rounds=3)
+    assert len(result) == 100
+    assert result["text"].str.len().min() >= document_size * 0.9
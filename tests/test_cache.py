@@ -0,0 +1,138 @@
+from pathlib import Path
+from pickle import dumps, loads  # nosec: B403
+from time import sleep
+from typing import Any, List
+
+from chatnoir_pyterrier.cache import DocumentContentCache, ResultCache
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve
+
+
+def test_document_content_cache(tmp_path: Path):
+    cache = DocumentContentCache(tmp_path)
+    assert cache.get("clueweb12", "clueweb12-0000tw-00-00000", plain=True) is None
+
+    cache.set("clueweb12", "clueweb12-0000tw-00-00000", plain=True, contents="text")
+    cache.set("clueweb12", "clueweb12-0000tw-00-00000", plain=False, contents="<p>text</p>")
+    assert cache.get("clueweb12", "clueweb12-0000tw-00-00000", plain=True) == "text"
+    assert cache.get("clueweb12", "clueweb12-0000tw-00-00000", plain=False) == "<p>text</p>"
+    assert cache.get("clueweb09", "clueweb12-0000tw-00-00000", plain=True) is None
+    assert len(cache) == 2
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_document_content_cache_shared(tmp_path: Path):
+    cache = DocumentContentCache(tmp_path)
+    cache.set("clueweb12", "doc", plain=True, contents="text")
+    other_cache = loads(dumps(cache))  # nosec: B301
+    assert other_cache.get("clueweb12", "doc", plain=True) == "text"
+
+
+def test_document_content_cache_eviction(tmp_path: Path):
+    cache = DocumentContentCache(tmp_path, compression_level=0, max_size=10)
+    cache.set("clueweb12", "doc1", plain=True, contents="aaaa")
+    cache.set("clueweb12", "doc2", plain=True, contents="bbbb")
+    # Access the first document so that the second one is least recently used.
+    assert cache.get("clueweb12", "doc1", plain=True) == "aaaa"
+    cache.set("clueweb12", "doc3", plain=True, contents="cccc")
+    assert cache.size() <= 10
+    assert cache.get("clueweb12", "doc1", plain=True) == "aaaa"
+    assert cache.get("clueweb12", "doc2", plain=True) is None
+    assert cache.get("clueweb12", "doc3", plain=True) == "cccc"
+
+
+def test_document_content_cache_size(tmp_path: Path):
+    cache = DocumentContentCache(tmp_path, compression_level=0, max_size=10)
+    cache.set("clueweb12", "doc1", plain=True, contents="aaaa")
+    cache.set("clueweb12", "doc1", plain=True, contents="aa")
+    cache.set("clueweb12", "doc2", plain=True, contents="bbbb")
+    assert cache.size() == 6
+    cache.set("clueweb12", "doc3", plain=True, contents="cccccc")
+    assert cache.size() == 10
+    cache.clear()
+    assert cache.size() == 0
+
+
+def test_document_content_cache_read_only_hits(tmp_path: Path):
+    cache = DocumentContentCache(tmp_path, max_size=1_000)
+    cache.set("clueweb12", "doc", plain=True, contents="text")
+    connection = cache._store._connection
+    changes = connection.total_changes
+    for _ in range(10):
+        assert cache.get("clueweb12", "doc", plain=True) == "text"
+    # Access times are written in batches, not on every hit.
+    assert connection.total_changes == changes
+
+
+def test_result_cache_truncate():
+    cache = ResultCache()
+    results = ["a", "b", "c", "d"]
+    cache.set("key", num_results=4, results=results)
+    assert cache.get("key", num_results=2) == ["a", "b"]
+    assert cache.get("key", num_results=4) == results
+    assert cache.get("key", num_results=5) is None
+    assert cache.get("key", num_results=None) is None
+    assert cache.get("other key", num_results=2) is None
+
+
+def test_result_cache_complete():
+    cache = ResultCache()
+    results = ["a", "b"]
+    # Fewer results than requested, so there are no more results.
+    cache.set("key", num_results=4, results=results)
+    assert cache.get("key", num_results=10) == results
+    assert cache.get("key", num_results=None) == results
+
+
+def test_result_cache_ttl():
+    cache = ResultCache(ttl=0.01)
+    results = ["a", "b"]
+    cache.set("key", num_results=2, results=results)
+    sleep(0.02)
+    assert cache.get("key", num_results=2) is None
+
+
+def test_result_cache_eviction():
+    cache = ResultCache(max_entries=1)
+    results = ["a"]
+    cache.set("key1", num_results=1, results=results)
+    cache.set("key2", num_results=1, results=results)
+    assert len(cache) == 1
+    assert cache.get("key1", num_results=1) is None
+    assert cache.get("key2", num_results=1) == results
+
+
+def test_result_cache_persistent(tmp_path: Path):
+    cache = ResultCache(tmp_path)
+    results: List[Any] = ["a", "b"]
+    cache.set("key", num_results=2, results=results)
+    assert ResultCache(tmp_path).get("key", num_results=1) == ["a"]
+
+
+def test_document_content_cache_metadata(tmp_path: Path):
+    cache = DocumentContentCache(tmp_path, store_metadata=True)
+    with MockChatNoirServer() as server:
+        results = ChatNoirRetrieve(api_key="test", session=server.session(), num_results=3) \
+            ._search_results("python library", explain=False)[0]
+    assert cache.get_metadata(results[0].index, results[0].uuid) is None
+
+    cache.set_metadata(results)
+    metadata = cache.get_many_metadata([(result.index, result.uuid) for result in reversed(results)])
+    assert [values["trec_id"] for values in metadata if values is not None] == \
+        [result.trec_id for result in reversed(results)]
+    assert metadata[0] == {
+        "trec_id": results[-1].trec_id,
+        "warc_id": results[-1].warc_id,
+        "crawl_date": results[-1].crawl_date,
+        "target_hostname": results[-1].target_hostname,
+        "target_uri": results[-1].target_uri,
+        "cache_uri": results[-1].cache_uri,
+        "page_rank": results[-1].page_rank,
+        "spam_rank": results[-1].spam_rank,
+        "title_text": results[-1].title.text,
+        "content_type": results[-1].content_type,
+        "language": results[-1].language,
+    }
+    assert len(cache) == 3
@@ -0,0 +1,90 @@
+from pathlib import Path
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+from pytest import raises
+
+from chatnoir_pyterrier.cassette import Cassette, CassetteMissError
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, Feature
+from chatnoir_pyterrier.session import ChatNoirSession
+
+_topics = DataFrame({
+    "qid": ["1", "2"],
+    "query": ["python library", "search engine"],
+})
+
+
+def test_cassette_key():
+    key = Cassette.key("POST", "api/v1/_search", None, b'{"apikey": "a", "query": "q", "index": ["b", "a"]}')
+    assert key == Cassette.key("POST", "api/v1/_search", None, b'{"apikey": "b", "query": "q", "index": ["a", "b"]}')
+    assert key != Cassette.key("POST", "api/v1/_phrases", None, b'{"apikey": "a", "query": "q", "index": ["a", "b"]}')
+    assert Cassette.key("GET", "cache", {"uuid": "1", "plain": "true"}, None) != \
+        Cassette.key("GET", "cache", {"uuid": "1", "plain": "false"}, None)
+
+
+def test_cassette_replay(tmp_path: Path):
+    with MockChatNoirServer(document_size=100) as server:
+        recorded = ChatNoirRetrieve(
+            api_key="test",
+            session=server.session(),
+            features=Feature.TITLE_TEXT | Feature.CONTENTS_PLAIN,
+            cassette=Cassette(tmp_path, mode="record"),
+        ).transform(_topics)
+        url = server.url
+
+    # Replay without the server.
+    retrieve = ChatNoirRetrieve(
+        api_key="other",
+        session=ChatNoirSession(base_url=url),
+        features=Feature.TITLE_TEXT | Feature.CONTENTS_PLAIN,
+        cassette=Cassette(tmp_path, mode="replay"),
+    )
+    recorded_files = {path.name: path.read_bytes() for path in tmp_path.iterdir() if not path.name.endswith("-shm")}
+    assert_frame_equal(retrieve.transform(_topics), recorded)
+    with raises(RuntimeError):
+        retrieve.search("web archive")
+    # Replaying never writes to the cassette.
+    assert {path.name: path.read_bytes() for path in tmp_path.iterdir() if not path.name.endswith("-shm")} == \
+        recorded_files
+
+
+def test_cassette_replay_contents_miss(tmp_path: Path):
+    with MockChatNoirServer(document_size=100) as server:
+        ChatNoirRetrieve(
+            api_key="test",
+            session=server.session(),
+            cassette=Cassette(tmp_path, mode="record"),
+        ).transform(_topics)
+        url = server.url
+
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=ChatNoirSession(base_url=url),
+        features=Feature.CONTENTS_PLAIN,
+        cassette=Cassette(tmp_path, mode="replay"),
+    )
+    with raises(CassetteMissError):
+        retrieve.transform(_topics)
+
+
+def test_cassette_replay_empty(tmp_path: Path):
+    cassette = Cassette(tmp_path, mode="replay")
+    assert len(cassette) == 0
+    with raises(CassetteMissError):
+        cassette.lookup("key", "GET cache")
+    assert not (tmp_path / "responses.sqlite3").exists()
+
+
+def test_cassette_record_missing(tmp_path: Path, mock_server: MockChatNoirServer):
+    cassette = Cassette(tmp_path, mode="record_missing")
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        cassette=cassette,
+    )
+    searches = mock_server.requests.get("searches", 0)
+    retrieve.search("python library")
+    retrieve.search("python library")
+    assert mock_server.requests["searches"] == searches + 1
+    assert len(cassette) == 1
@@ -0,0 +1,113 @@
+from asyncio import run
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+from pytest import raises, MonkeyPatch
+
+from chatnoir_pyterrier.checkpoint import Checkpoint
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, Feature
+
+_topics = DataFrame({
+    "qid": [str(i) for i in range(7)],
+    "query": [f"query {i}" for i in range(7)],
+})
+
+
+def _retrieve(server: MockChatNoirServer, checkpoint: Optional[Checkpoint]) -> ChatNoirRetrieve:
+    return ChatNoirRetrieve(
+        api_key="test",
+        session=server.session(),
+        features=Feature.TITLE | Feature.CONTENTS_PLAIN,
+        num_results=5,
+        checkpoint=checkpoint,
+    )
+
+
+def test_checkpoint_invalid_chunk_size(tmp_path: Path):
+    with raises(ValueError):
+        Checkpoint(tmp_path, chunk_size=0)
+
+
+def test_checkpoint_transform(tmp_path: Path):
+    with MockChatNoirServer(document_size=100) as server:
+        expected = _retrieve(server, checkpoint=None).transform(_topics)
+        searches = server.requests["searches"]
+
+        checkpoint = Checkpoint(tmp_path, chunk_size=3)
+        assert_frame_equal(_retrieve(server, checkpoint).transform(_topics), expected)
+        assert len(checkpoint) == 7
+        assert server.requests["searches"] == 2 * searches
+
+        # Finished queries are not searched again.
+        retrieve = _retrieve(server, Checkpoint(tmp_path, chunk_size=3))
+        assert_frame_equal(retrieve.transform(_topics), expected)
+        assert_frame_equal(run(retrieve.atransform(_topics)), expected)
+        assert server.requests["searches"] == 2 * searches
+        assert set(retrieve.pages_fetched.values()) == {0}
+
+
+def test_checkpoint_resume(tmp_path: Path, monkeypatch: MonkeyPatch):
+    with MockChatNoirServer(document_size=100) as server:
+        expected = _retrieve(server, checkpoint=None).transform(_topics)
+
+        # Fail while searching the second chunk.
+        checkpoint = Checkpoint(tmp_path, chunk_size=3)
+        retrieve = _retrieve(server, checkpoint)
+        search_query = retrieve._search_query
+
+        def failing_search_query(row: Dict[str, Any]):
+            if row["qid"] >= "3":
+                raise RuntimeError("API outage.")
+            return search_query(row)
+
+        monkeypatch.setattr(retrieve, "_search_query", failing_search_query)
+        with raises(RuntimeError):
+            retrieve.transform(_topics)
+        assert len(checkpoint) == 3
+
+        searches = server.requests["searches"]
+        resumed = _retrieve(server, Checkpoint(tmp_path, chunk_size=3))
+        assert_frame_equal(resumed.transform(_topics), expected)
+        assert server.requests["searches"] == searches + 4
+
+
+def test_checkpoint_config(tmp_path: Path):
+    with MockChatNoirServer(document_size=100) as server:
+        checkpoint = Checkpoint(tmp_path)
+        _retrieve(server, checkpoint).transform(_topics)
+        retrieve = _retrieve(server, checkpoint)
+        retrieve.num_results = 10
+        # Results for other parameters are not reused.
+        assert len(retrieve.transform(_topics)) == 70
+        assert len(checkpoint) == 14
+
+
+def test_checkpoint_topic_columns(tmp_path: Path):
+    with MockChatNoirServer(document_size=100) as server:
+        checkpoint = Checkpoint(tmp_path)
+        _retrieve(server, checkpoint).transform(_topics.assign(narrative="old"))
+        searches = server.requests["searches"]
+
+        # Restored results have the current topic columns.
+        changed = _topics.assign(narrative="new")
+        expected = _retrieve(server, checkpoint=None).transform(changed)
+        assert_frame_equal(_retrieve(server, checkpoint).transform(changed), expected)
+        expected = _retrieve(server, checkpoint=None).transform(_topics)
+        assert_frame_equal(_retrieve(server, checkpoint).transform(_topics), expected)
+        assert server.requests["searches"] == searches + 2 * len(_topics)
+
+
+def test_checkpoint_compact(tmp_path: Path):
+    with MockChatNoirServer(document_size=100) as server:
+        checkpoint = Checkpoint(tmp_path)
+        compact = _retrieve(server, checkpoint)
+        compact.compact = True
+        compact.transform(_topics)
+
+        # Compact results are not reused for uncompacted results, and vice versa.
+        expected = _retrieve(server, checkpoint=None).transform(_topics)
+        assert_frame_equal(_retrieve(server, checkpoint).transform(_topics), expected)
+        assert len(checkpoint) == 2 * len(_topics)
@@ -0,0 +1,57 @@
+from typing import List
+from uuid import uuid4
+
+from chatnoir_api import Result
+from chatnoir_api.v1.model import ResultResponse
+
+from chatnoir_pyterrier.fusion import fuse
+
+
+def _ranking(index: str, scores: List[float]) -> List[Result]:
+    return [
+        ResultResponse.from_dict({
+            "score": score,
+            "uuid": str(uuid4()),
+            "index": index,
+            "trec_id": None,
+            "target_hostname": "example.com",
+            "target_uri": "https://example.com/",
+            "page_rank": None,
+            "spam_rank": None,
+            "title": "",
+            "snippet": "",
+            "warc_id": None,
+            "cache_uri": "",
+            "crawl_date": None,
+            "content_type": None,
+            "lang": "en",
+        })
+        for score in scores
+    ]
+
+
+def test_fuse_score():
+    a = _ranking("cw12", [10, 5, 1])
+    b = _ranking("cw22", [7, 6])
+    fused = fuse([a, b], method="score")
+    assert [result.score for result in fused] == [10, 7, 6, 5, 1]
+    assert fused[1] is b[0]
+
+
+def test_fuse_rrf():
+    a = _ranking("cw12", [10, 5, 1])
+    b = _ranking("cw22", [700, 600])
+    fused = fuse([a, b], method="rrf", rrf_k=60)
+    # Interleaves the rankings, independent of the score scales.
+    assert [result.uuid for result in fused] == [a[0].uuid, b[0].uuid, a[1].uuid, b[1].uuid, a[2].uuid]
+    assert fused[0].score == 1 / 61
+
+
+def test_fuse_combsum():
+    a = _ranking("cw12", [10, 5, 0])
+    b = _ranking("cw22", [700, 400, 100])
+    fused = fuse([a, b], method="combsum")
+    assert [result.score for result in fused] == [1.0, 1.0, 0.5, 0.5, 0.0, 0.0]
+    # The same result in multiple rankings is summed.
+    fused = fuse([a, a], method="combsum")
+    assert [result.score for result in fused] == [2.0, 1.0, 0.0]
@@ -0,0 +1,97 @@
+from asyncio import run
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+from pytest import raises
+
+from chatnoir_pyterrier.hedge import HedgingPolicy
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, Feature
+
+_topics = DataFrame({
+    "qid": [str(i) for i in range(15)],
+    "query": [f"query {i}" for i in range(15)],
+})
+
+
+def test_hedging_invalid():
+    with raises(ValueError):
+        HedgingPolicy(percentile=100)
+    with raises(ValueError):
+        HedgingPolicy(budget=2)
+
+
+def test_hedging_delay():
+    hedging = HedgingPolicy(percentile=50, min_samples=3)
+    assert hedging.delay("search") is None
+    for seconds in (0.1, 0.2, 0.3):
+        hedging.record("search", seconds)
+    assert hedging.delay("search") == 0.2
+    # Latencies are tracked per kind of request.
+    assert hedging.delay("cache") is None
+
+
+def test_hedging_budget():
+    hedging = HedgingPolicy(budget=0.1)
+    for _ in range(9):
+        hedging.delay("search")
+    assert not hedging.fire()
+    hedging.delay("search")
+    assert hedging.fire()
+    assert not hedging.fire()
+    assert hedging.stats().fired == 1
+
+
+def test_hedging_tail_latency():
+    with MockChatNoirServer(latency_seconds=0.005, slow_rate=0.2, slow_latency_seconds=0.1, seed=1) as server:
+        expected = ChatNoirRetrieve(
+            api_key="test",
+            session=server.session(),
+            features=Feature.TITLE_TEXT | Feature.CONTENTS_PLAIN,
+            num_results=2,
+        ).transform(_topics)
+
+        hedging = HedgingPolicy(percentile=50, min_samples=5, budget=0.5)
+        retrieve = ChatNoirRetrieve(
+            api_key="test",
+            session=server.session(hedging=hedging),
+            features=Feature.TITLE_TEXT | Feature.CONTENTS_PLAIN,
+            num_results=2,
+            collect_stats=True,
+        )
+        # Duplicate requests do not change the results.
+        assert_frame_equal(retrieve.transform(_topics), expected)
+        stats = hedging.stats()
+        assert stats.fired > 0
+        assert stats.won > 0
+        assert retrieve.stats.counters["hedges_fired"] == stats.fired
+        assert retrieve.stats.counters["hedges_won"] == stats.won
+
+        assert_frame_equal(run(retrieve.atransform(_topics)), expected)
+        assert hedging.stats().fired > stats.fired
+
+
+def test_hedging_no_budget():
+    with MockChatNoirServer(latency_seconds=0.005) as server:
+        session = server.session(pool_size=2, hedging=HedgingPolicy(min_samples=1, budget=0))
+        retrieve = ChatNoirRetrieve(api_key="test", session=session, num_results=2, max_workers=8)
+        retrieve.transform(_topics)
+        # Without budget for duplicates, requests are sent on the calling threads.
+        assert session._executor is None
+        assert session.hedging is not None and session.hedging.stats().fired == 0
+
+
+def test_hedging_full_concurrency():
+    with MockChatNoirServer(latency_seconds=0.005, slow_rate=0.5, slow_latency_seconds=0.05, seed=1) as server:
+        hedging = HedgingPolicy(percentile=50, min_samples=1, budget=1)
+        retrieve = ChatNoirRetrieve(
+            api_key="test-hedging-concurrency",
+            session=server.session(hedging=hedging),
+            num_results=2,
+            max_concurrency=1,
+        )
+        retrieve.transform(_topics)
+        # Duplicates never wait for the concurrency slot held by the request they duplicate.
+        assert hedging.stats().fired == 0
+        assert run(retrieve.atransform(_topics)) is not None
+        assert hedging.stats().fired == 0
@@ -0,0 +1,77 @@
+from gzip import open as open_gzip
+from pathlib import Path
+from uuid import UUID
+
+from pandas import DataFrame, Categorical, read_json, read_parquet
+from pytest import importorskip
+
+from chatnoir_pyterrier.io import write_results, to_arrow
+
+
+def _chunks():
+    yield DataFrame({
+        "qid": ["1", "1"],
+        "query": ["python library", "python library"],
+        "docno": ["doc1", "doc2"],
+        "score": [2.0, 1.0],
+        "rank": [0, 1],
+        "uuid": [UUID(int=1), UUID(int=2)],
+    })
+    yield DataFrame()
+    yield DataFrame({
+        "qid": ["2"],
+        "query": ["search engine"],
+        "docno": ["doc3"],
+        "score": [3.0],
+        "rank": [0],
+        "uuid": [UUID(int=3)],
+    })
+
+
+def test_write_results_trec(tmp_path: Path):
+    path = tmp_path / "run.txt"
+    write_results(_chunks(), path, run_name="test")
+    assert path.read_text().splitlines() == [
+        "1 Q0 doc1 0 2.0 test",
+        "1 Q0 doc2 1 1.0 test",
+        "2 Q0 doc3 0 3.0 test",
+    ]
+
+
+def test_write_results_jsonl(tmp_path: Path):
+    path = tmp_path / "run.jsonl.gz"
+    write_results(_chunks(), path)
+    with open_gzip(path, "rt") as file:
+        results = read_json(file, lines=True, dtype={"qid": str})
+    assert list(results["qid"]) == ["1", "1", "2"]
+    assert list(results["docno"]) == ["doc1", "doc2", "doc3"]
+    assert list(results["uuid"]) == [str(UUID(int=i)) for i in (1, 2, 3)]
+
+
+def test_write_results_parquet(tmp_path: Path):
+    importorskip("pyarrow")
+    path = tmp_path / "run.parquet"
+    write_results(_chunks(), path)
+    results = read_parquet(path)
+    assert list(results["qid"]) == ["1", "1", "2"]
+    assert list(results["docno"]) == ["doc1", "doc2", "doc3"]
+
+
+def test_to_arrow():
+    importorskip("pyarrow")
+    table = to_arrow(_chunks())
+    assert table.num_rows == 3
+    assert table.column("docno").to_pylist() == ["doc1", "doc2", "doc3"]
+    assert table.column("uuid").to_pylist() == [str(UUID(int=i)) for i in (1, 2, 3)]
+
+
+def test_to_arrow_categorical():
+    importorskip("pyarrow")
+    # Later chunks have more categories than fit into the first chunk's indices.
+    chunks = [
+        DataFrame({"qid": Categorical(["1"]), "score": [1.0]}),
+        DataFrame({"qid": Categorical([str(i) for i in range(300)]), "score": [1.0] * 300}),
+    ]
+    table = to_arrow(chunks)
+    assert table.num_rows == 301
+    assert table.column("qid").to_pylist()[-1] == "299"
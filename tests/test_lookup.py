@@ -0,0 +1,85 @@
+from asyncio import run
+from dataclasses import replace
+from pathlib import Path
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+from pytest import raises
+
+from chatnoir_pyterrier.cache import DocumentContentCache
+from chatnoir_pyterrier.lookup import ChatNoirLookup
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, Feature
+
+_topics = DataFrame({
+    "qid": ["1", "2"],
+    "query": ["python library", "search engine"],
+})
+
+_metadata_features = Feature.TARGET | Feature.RANKS | Feature.TITLE_TEXT | Feature.CRAWL_DATE
+
+
+def test_lookup_invalid_features():
+    with raises(ValueError):
+        ChatNoirLookup(features=Feature.SNIPPET)
+
+
+def test_lookup_without_metadata_cache(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(api_key="test", session=mock_server.session(), index="clueweb22/b")
+    with raises(RuntimeError):
+        ChatNoirLookup(retrieve, features=Feature.TARGET_URI).lookup(["clueweb22-en0000-00-00000"])
+
+
+def test_lookup_metadata(mock_server: MockChatNoirServer, tmp_path: Path):
+    cache = DocumentContentCache(tmp_path, store_metadata=True)
+    searched = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        index="clueweb22/b",
+        features=_metadata_features,
+        num_results=10,
+        filter_unknown=True,
+        content_cache=cache,
+    ).transform(_topics)
+    searches = mock_server.requests["searches"]
+
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        index="clueweb22/b",
+        content_cache=cache,
+        collect_stats=True,
+    )
+    lookup = ChatNoirLookup(retrieve, features=Feature.UUID | _metadata_features)
+    docnos = list(reversed(searched["docno"].tolist())) + ["unknown"]
+    result = lookup.lookup(docnos, chunk_size=7)
+    # Metadata is looked up without searching again.
+    assert mock_server.requests["searches"] == searches
+    assert result["docno"].tolist() == docnos
+    assert lookup.stats.counters["metadata_hits"] == len(docnos) - 1
+    assert lookup.stats.counters["metadata_misses"] == 1
+
+    columns = ["docno", "target_hostname", "target_uri", "page_rank", "spam_rank", "title_text", "crawl_date"]
+    expected = searched[columns].iloc[::-1].astype(object).reset_index(drop=True)
+    assert_frame_equal(result[columns].iloc[:-1].astype(object), expected)
+    assert result["target_uri"].iloc[-1] is None
+
+    assert_frame_equal(run(lookup.atransform(DataFrame({"docno": docnos}))), result)
+
+    with raises(RuntimeError):
+        replace(lookup, strict=True).lookup(docnos)
+    assert_frame_equal(replace(lookup, strict=True).lookup(docnos[:-1]), result.iloc[:-1])
+
+
+def test_lookup_contents(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        index="clueweb22/b",
+        features=Feature.UUID | Feature.CONTENTS_PLAIN,
+        num_results=5,
+    )
+    searched = retrieve.transform(_topics)
+    result = ChatNoirLookup(retrieve, features=Feature.UUID | Feature.CONTENTS_PLAIN).lookup(searched["docno"])
+    assert result["uuid"].tolist() == searched["uuid"].tolist()
+    assert result["text"].tolist() == searched["text"].tolist()
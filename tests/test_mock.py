@@ -0,0 +1,323 @@
+from asyncio import run
+from dataclasses import replace
+from pathlib import Path
+from threading import get_ident
+from typing import List, Dict, Any, Optional, Sequence, Set, Tuple
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+from pytest import raises, MonkeyPatch
+
+from chatnoir_pyterrier.cache import DocumentContentCache, ResultCache, _SqliteStore
+from chatnoir_pyterrier.cassette import Cassette
+from chatnoir_pyterrier.checkpoint import Checkpoint
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, Feature
+
+_topics = DataFrame({
+    "qid": ["2", "1"],
+    "query": ["search engine", "python library"],
+})
+
+
+def test_mock_transform(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        num_results=20,
+    )
+    result = retrieve.transform(_topics)
+    assert len(result) == 40
+    assert list(result["qid"].drop_duplicates()) == ["2", "1"]
+    for _, query_result in result.groupby("qid"):
+        assert list(query_result["rank"]) == list(range(20))
+        assert query_result["score"].is_monotonic_decreasing
+    # Results are reproducible.
+    assert_frame_equal(result, retrieve.transform(_topics))
+    with raises(RuntimeError):
+        retrieve.transform(DataFrame({"qid": ["1", "1"], "query": ["python library", "search engine"]}))
+
+
+
+def test_mock_transform_iter(mock_server: MockChatNoirServer, monkeypatch: MonkeyPatch):
+    topics = DataFrame({
+        "qid": [str(i) for i in range(5)],
+        "query": [f"query {i}" for i in range(5)],
+    })
+    retrieve = ChatNoirRetrieve(api_key="test", session=mock_server.session())
+    split_sizes: List[int] = []
+    split_queries = retrieve._split_queries
+
+    def spy_split_queries(topics: DataFrame) -> List[Dict[str, Any]]:
+        split_sizes.append(len(topics))
+        return split_queries(topics)
+
+    monkeypatch.setattr(retrieve, "_split_queries", spy_split_queries)
+    chunks = retrieve.transform_iter(topics, chunk_size=2)
+    assert len(next(chunks)) == 20
+    # Topics are only split chunk by chunk.
+    assert split_sizes == [2]
+    assert [len(chunk) for chunk in chunks] == [20, 10]
+    assert split_sizes == [2, 2, 1]
+
+
+def test_mock_async_stores(tmp_path: Path, mock_server: MockChatNoirServer, monkeypatch: MonkeyPatch):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.CONTENTS_PLAIN,
+        content_cache=DocumentContentCache(tmp_path / "contents", store_metadata=True),
+        result_cache=ResultCache(tmp_path / "results"),
+        cassette=Cassette(tmp_path / "cassette"),
+        checkpoint=Checkpoint(tmp_path / "checkpoint"),
+    )
+    threads: Set[int] = set()
+    get, set_many = _SqliteStore.get, _SqliteStore.set_many
+
+    def spy_get(store: _SqliteStore, key: str) -> Optional[bytes]:
+        threads.add(get_ident())
+        return get(store, key)
+
+    def spy_set_many(store: _SqliteStore, items: Sequence[Tuple[str, bytes]]) -> None:
+        threads.add(get_ident())
+        set_many(store, items)
+
+    monkeypatch.setattr(_SqliteStore, "get", spy_get)
+    monkeypatch.setattr(_SqliteStore, "set_many", spy_set_many)
+    assert len(run(retrieve.atransform(_topics))) == 20
+    # The stores are never accessed from the event loop's thread.
+    assert len(threads) > 0
+    assert get_ident() not in threads
+
+
+def test_mock_paging(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        num_results=60,
+        page_size=20,
+        filter_unknown=True,
+    )
+    result = retrieve.search("python library")
+    assert len(result) == 60
+    assert result["docno"].notna().all()
+    assert retrieve.pages_fetched["1"] >= 3
+
+
+def test_mock_features(mock_server: MockChatNoirServer, feature: Feature):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=feature,
+        num_results=5,
+    )
+    result = retrieve.search("python library")
+    assert len(result) == 5
+    if Feature.CONTENTS_PLAIN in feature:
+        assert result["text"].notna().all()
+
+
+def test_mock_feature_set(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features={Feature.TITLE_TEXT, Feature.RANKS, Feature.CONTENTS_PLAIN},
+        num_results=5,
+    )
+    expected = replace(retrieve, features=Feature.TITLE_TEXT | Feature.RANKS | Feature.CONTENTS_PLAIN)
+    result = retrieve.transform(_topics)
+    assert_frame_equal(result, expected.transform(_topics))
+    # The result columns are known before retrieving.
+    assert list(result.columns) == ["qid", "query", *retrieve.result_columns]
+    assert result["text"].notna().all()
+
+    # Replaced features take effect.
+    retrieve.features = Feature.UUID
+    assert list(retrieve.transform(_topics).columns) == ["qid", "query", "docno", "score", "uuid", "rank"]
+
+def test_mock_phrases(mock_server: MockChatNoirServer):
+    phrase_searches = mock_server.requests.get("phrase_searches", 0)
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        phrases=True,
+    )
+    assert len(retrieve.search("python library")) == 10
+    assert mock_server.requests["phrase_searches"] == phrase_searches + 1
+
+
+def test_mock_retries():
+    with MockChatNoirServer(error_rate=0.3, document_size=100) as server:
+        retrieve = ChatNoirRetrieve(
+            api_key="test",
+            session=server.session(),
+            features=Feature.CONTENTS_PLAIN,
+            retries=20,
+            backoff_seconds=0,
+            collect_stats=True,
+        )
+        result = retrieve.transform(_topics)
+    assert result["text"].notna().all()
+    assert retrieve.stats.counters["retries"] == server.requests["errors"]
+
+
+def test_mock_async(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.TITLE_TEXT | Feature.CONTENTS,
+        num_results=30,
+        page_size=20,
+        max_workers=2,
+    )
+    assert_frame_equal(
+        run(retrieve.atransform(_topics)),
+        retrieve.transform(_topics),
+    )
+
+
+def test_mock_fan_out(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        index={"clueweb12", "clueweb22/b"},
+        fan_out=True,
+        fusion="rrf",
+        num_results=10,
+        num_results_per_index={"clueweb12": 2},
+    )
+    result = retrieve.search("python library")
+    assert len(result) == 10
+    assert (result["index"] == "clueweb12").sum() == 2
+    assert result["score"].is_monotonic_decreasing
+    assert retrieve.pages_fetched["1"] == 2
+    assert_frame_equal(run(retrieve.asearch("python library")), result)
+
+
+def test_mock_batch(mock_server: MockChatNoirServer):
+    topics = DataFrame({
+        "qid": [str(i) for i in range(7)],
+        "query": [f"query {i}" for i in range(7)],
+    })
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        num_results=30,
+        page_size=20,
+        filter_unknown=True,
+    )
+    batched = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        num_results=30,
+        page_size=20,
+        filter_unknown=True,
+        batch_size=3,
+    )
+    assert_frame_equal(batched.transform(topics), retrieve.transform(topics))
+    assert batched.pages_fetched == retrieve.pages_fetched
+
+
+def test_mock_batch_out_of_order():
+    topics = DataFrame({
+        "qid": [str(i) for i in range(7)],
+        "query": [f"query {i}" for i in range(7)],
+    })
+    # Slow requests make pages of the same query arrive out of order.
+    with MockChatNoirServer(slow_rate=0.3, slow_latency_seconds=0.05) as server:
+        retrieve = ChatNoirRetrieve(
+            api_key="test",
+            session=server.session(),
+            num_results=50,
+            page_size=10,
+        )
+        batched = replace(retrieve, batch_size=3, prefetch_pages=2)
+        assert_frame_equal(batched.transform(topics), retrieve.transform(topics))
+
+
+def test_mock_deduplicate_queries(mock_server: MockChatNoirServer):
+    topics = DataFrame({
+        "qid": ["1", "2", "3", "4"],
+        "query": ["python library", " python  library", "Python Library", "python OR library"],
+    })
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        num_results=30,
+        page_size=20,
+        normalize_case=True,
+        collect_stats=True,
+    )
+    searches = mock_server.requests.get("searches", 0)
+    result = retrieve.transform(topics)
+    assert mock_server.requests["searches"] == searches + 4
+    assert retrieve.stats.counters["duplicate_queries"] == 2
+    assert retrieve.stats.counters["requests_saved"] == 4
+    assert list(result["query"].drop_duplicates()) == list(topics["query"])
+    docnos = result.groupby("qid")["docno"].apply(list)
+    assert docnos["1"] == docnos["2"] == docnos["3"]
+
+    not_deduplicated = replace(retrieve, deduplicate_queries=False, normalize_case=False)
+    assert_frame_equal(
+        not_deduplicated.transform(topics.iloc[:2]),
+        retrieve.transform(topics.iloc[:2]),
+    )
+
+
+def test_mock_compact(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.INDEX | Feature.TARGET_HOSTNAME | Feature.LANGUAGE | Feature.TITLE_TEXT,
+        num_results=50,
+    )
+    result = retrieve.transform(_topics)
+    compact = replace(retrieve, compact=True).transform(_topics)
+    assert compact["qid"].dtype == "category"
+    assert compact["target_hostname"].dtype == "category"
+    assert compact["score"].dtype == "float32"
+    assert_frame_equal(compact, result.astype(compact.dtypes.to_dict()))
+    assert compact.memory_usage(deep=True).sum() < result.memory_usage(deep=True).sum() / 2
+
+
+def test_mock_shards(mock_server: MockChatNoirServer):
+    topics = DataFrame({
+        "qid": [str(i) for i in range(7)],
+        "query": [f"query {i}" for i in range(7)],
+    })
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.TITLE_TEXT | Feature.CONTENTS_PLAIN,
+        num_results=5,
+        collect_stats=True,
+    )
+    expected = retrieve.transform(topics)
+    for backend in ("thread", "process"):
+        sharded = replace(retrieve, backend=backend, n_shards=3)
+        assert_frame_equal(sharded.transform(topics), expected)
+        assert_frame_equal(run(sharded.atransform(topics)), expected)
+        assert sharded.pages_fetched == retrieve.pages_fetched
+        assert sharded.stats.counters["requests"] == retrieve.stats.counters["requests"]
+
+
+def test_mock_shards_invalid():
+    with raises(ValueError):
+        ChatNoirRetrieve(n_shards=0)
+
+
+def test_mock_hash():
+    retrieve = ChatNoirRetrieve(api_key="test", index={"clueweb12", "clueweb22/b"}, fan_out=True)
+    # Retrievers that rank differently hash differently.
+    for changed in (
+        replace(retrieve, fan_out=False),
+        replace(retrieve, num_results_per_index={"clueweb12": 5}),
+        replace(retrieve, fusion="rrf"),
+        replace(retrieve, rrf_k=10),
+        replace(retrieve, compact=True),
+    ):
+        assert hash(changed) != hash(retrieve)
+    assert hash(replace(retrieve)) == hash(retrieve)
+    # Sets of features hash like the combined flag.
+    assert hash(replace(retrieve, features={Feature.TITLE_TEXT, Feature.SPAM_RANK})) == \
+        hash(replace(retrieve, features=Feature.TITLE_TEXT | Feature.SPAM_RANK))
@@ -0,0 +1,117 @@
+from asyncio import gather, run, sleep as async_sleep
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import monotonic, sleep
+
+from pytest import raises
+
+from chatnoir_pyterrier.ratelimit import RateLimiter, shared_rate_limiter, is_throttling_error
+from chatnoir_pyterrier.session import ChatNoirHTTPError
+
+
+def test_rate_limiter_rate():
+    rate_limiter = RateLimiter(requests_per_second=50)
+    start = monotonic()
+    for _ in range(6):
+        with rate_limiter.request():
+            pass
+    # The first request is immediate, the next 5 requests are spaced by 20ms.
+    assert monotonic() - start >= 0.09
+    stats = rate_limiter.stats()
+    assert stats.requests == 6
+    assert stats.total_wait_seconds > 0
+
+
+def test_rate_limiter_concurrency():
+    rate_limiter = RateLimiter(max_concurrency=2)
+    lock = Lock()
+    concurrent = 0
+    max_concurrent = 0
+
+    def request(_: int) -> None:
+        nonlocal concurrent, max_concurrent
+        with rate_limiter.request():
+            with lock:
+                concurrent += 1
+                max_concurrent = max(max_concurrent, concurrent)
+            sleep(0.01)
+            with lock:
+                concurrent -= 1
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(request, range(16)))
+    assert max_concurrent <= 2
+
+
+def test_rate_limiter_try_request():
+    rate_limiter = RateLimiter(max_concurrency=1)
+    with rate_limiter.request():
+        with rate_limiter.try_request() as acquired:
+            assert not acquired
+    with rate_limiter.try_request() as acquired:
+        assert acquired
+        with rate_limiter.try_request() as acquired_again:
+            assert not acquired_again
+
+    async def try_request() -> bool:
+        async with rate_limiter.atry_request() as acquired:
+            return acquired
+
+    assert run(try_request())
+    assert rate_limiter.stats().requests == 3
+
+
+def test_rate_limiter_async():
+    rate_limiter = RateLimiter(requests_per_second=50, max_concurrency=2)
+    concurrent = 0
+    max_concurrent = 0
+
+    async def request() -> None:
+        nonlocal concurrent, max_concurrent
+        async with rate_limiter.arequest():
+            concurrent += 1
+            max_concurrent = max(max_concurrent, concurrent)
+            await async_sleep(0.01)
+            concurrent -= 1
+
+    async def requests() -> None:
+        await gather(*(request() for _ in range(6)))
+
+    start = monotonic()
+    run(requests())
+    assert monotonic() - start >= 0.09
+    assert max_concurrent <= 2
+    assert rate_limiter.stats().requests == 6
+
+
+def test_rate_limiter_throttle():
+    rate_limiter = RateLimiter(requests_per_second=100)
+    with raises(ChatNoirHTTPError):
+        with rate_limiter.request():
+            raise ChatNoirHTTPError("ChatNoir API quota exceeded. Please throttle requests.", 429)
+    assert rate_limiter.requests_per_second == 50
+    assert rate_limiter.stats().throttled == 1
+
+    # Other errors do not slow down requests.
+    with raises(ValueError):
+        with rate_limiter.request():
+            raise ValueError()
+    assert rate_limiter.requests_per_second == 50
+
+    with rate_limiter.request():
+        pass
+    assert rate_limiter.requests_per_second == 51
+
+
+def test_is_throttling_error():
+    assert is_throttling_error(ChatNoirHTTPError("Too many requests.", 429))
+    assert is_throttling_error(ChatNoirHTTPError("Bad gateway.", 502))
+    assert not is_throttling_error(ChatNoirHTTPError("Quota exceeded, but the key is invalid.", 401))
+    # Errors without a status code are never throttling, whatever their message.
+    assert not is_throttling_error(RuntimeError("ChatNoir API Quota Exceeded."))
+
+
+def test_shared_rate_limiter():
+    rate_limiter = shared_rate_limiter("test-key", requests_per_second=10)
+    assert shared_rate_limiter("test-key", requests_per_second=10) is rate_limiter
+    assert shared_rate_limiter("other-key", requests_per_second=10) is not rate_limiter
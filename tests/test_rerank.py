@@ -0,0 +1,122 @@
+from asyncio import run
+from math import inf, nan
+
+from pandas import DataFrame, isna
+from pandas.testing import assert_frame_equal
+from pytest import raises
+
+from chatnoir_pyterrier.cache import ResultCache
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.rerank import ChatNoirFeatures
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, Feature
+
+
+def test_features_invalid_max_results():
+    with raises(ValueError):
+        ChatNoirFeatures(max_results=0)
+
+
+def test_features(mock_server: MockChatNoirServer):
+    ranking = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.PAGE_RANK,
+        num_results=50,
+        filter_unknown=True,
+    ).search("python library")
+    expected = ranking.iloc[[25, 3, 10]]
+    candidates = DataFrame({
+        "qid": ["1", "2", "1", "1", "1"],
+        "query": ["python library", "search engine", "python library", "python library", "python library"],
+        "docno": [expected["docno"].iloc[0], "unknown", "unknown", expected["docno"].iloc[1], expected["docno"].iloc[2]],
+        "score": [5.0, 4.0, 3.0, 2.0, 1.0],
+    })
+
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.PAGE_RANK,
+        page_size=10,
+        result_cache=ResultCache(),
+        filter_unknown=True,
+    )
+    features = ChatNoirFeatures(retrieve, max_results=100)
+    result = features.transform(candidates)
+
+    assert list(result["qid"]) == ["1", "1", "1", "1", "2"]
+    found = result.iloc[[0, 2, 3]]
+    assert list(found["docno"]) == list(expected["docno"])
+    assert list(found["score"]) == list(expected["score"])
+    assert list(found["page_rank"]) == list(expected["page_rank"])
+    assert list(found["rank"]) == [2, 0, 1]
+    assert result["score"].iloc[1] == -inf
+    assert result["rank"].iloc[1] == 3
+    assert isna(result["page_rank"].iloc[1])
+
+    searches = mock_server.requests["searches"]
+    assert_frame_equal(run(features.atransform(candidates)), result)
+    # Both queries have unknown candidates, so their results were cached up to the maximum depth.
+    assert mock_server.requests["searches"] == searches
+
+
+def test_features_stop_early(mock_server: MockChatNoirServer):
+    ranking = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        num_results=30,
+        filter_unknown=True,
+    ).search("python library")
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        page_size=10,
+        filter_unknown=True,
+        collect_stats=True,
+    )
+    features = ChatNoirFeatures(retrieve, max_results=100)
+    features.transform(ranking.iloc[[2, 12]][["qid", "query", "docno"]])
+    assert features.stats.counters["pages"] == 2
+
+
+def test_features_missing_docno(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.TITLE_TEXT,
+        num_results=100,
+    )
+    ranking = retrieve.search("python library")
+    # ChatNoir returns results with unknown TREC IDs, which must not match candidates without a docno.
+    assert ranking["docno"].isna().any()
+    docno = ranking["docno"].dropna().iloc[0]
+    candidates = DataFrame({
+        "qid": ["1", "1", "1"],
+        "query": ["python library"] * 3,
+        "docno": [None, docno, None],
+    })
+    result = ChatNoirFeatures(retrieve, max_results=100).transform(candidates)
+    missing = result["docno"].isna()
+    assert missing.sum() == 2
+    assert (result["score"][missing] == -inf).all()
+    assert result["title_text"][missing].isna().all()
+    assert result["title_text"][~missing].tolist() == ranking["title_text"][ranking["docno"] == docno].tolist()
+
+
+def test_features_missing_docno_stops_early(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        num_results=10,
+        page_size=10,
+        filter_unknown=True,
+    )
+    docno = retrieve.search("python library")["docno"].iloc[0]
+    # Missing docnos, e.g., NaN after merging, can never be found, so do not page for them.
+    candidates = DataFrame({
+        "qid": ["1", "1"],
+        "query": ["python library"] * 2,
+        "docno": [nan, docno],
+    })
+    searches = mock_server.requests["searches"]
+    ChatNoirFeatures(retrieve, max_results=100).transform(candidates)
+    assert mock_server.requests["searches"] == searches + 1
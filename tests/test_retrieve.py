@@ -1,3 +1,5 @@
+from asyncio import run
+
 from chatnoir_api import Index
 from pandas import DataFrame
 
@@ -80,3 +82,105 @@ def test_retrieve_feature(
         assert "content_type" in result.columns
     if Feature.LANGUAGE in feature:
         assert "language" in result.columns
+
+
+def test_retrieve_concurrent(api_key: str):
+    topics = DataFrame({
+        "qid": ["1", "2", "3"],
+        "query": ["python library", "search engine", "web archive"],
+    })
+    sequential = ChatNoirRetrieve(
+        api_key=api_key,
+        num_results=5,
+    ).transform(topics)
+    concurrent = ChatNoirRetrieve(
+        api_key=api_key,
+        num_results=5,
+        max_workers=3,
+    ).transform(topics)
+    assert list(concurrent["qid"]) == list(sequential["qid"])
+    assert list(concurrent["docno"]) == list(sequential["docno"])
+    assert list(concurrent["rank"]) == list(sequential["rank"])
+
+
+def test_retrieve_contents_concurrent(api_key: str):
+    topics = DataFrame({
+        "qid": ["1", "2"],
+        "query": ["python library", "python library"],
+    })
+    retrieve = ChatNoirRetrieve(
+        api_key=api_key,
+        index="msmarco-document-v2.1",
+        features=Feature.CONTENTS | Feature.CONTENTS_PLAIN,
+        num_results=3,
+        max_content_workers=4,
+    )
+    result = retrieve.transform(topics)
+    assert "contents" in result.columns
+    assert "contents_plain" in result.columns
+    assert result["contents_plain"].notna().all()
+
+
+def test_retrieve_iter(api_key: str):
+    topics = DataFrame({
+        "qid": ["1", "2", "3"],
+        "query": ["python library", "search engine", "web archive"],
+    })
+    retrieve = ChatNoirRetrieve(
+        api_key=api_key,
+        num_results=5,
+    )
+    chunks = list(retrieve.transform_iter(topics, chunk_size=2))
+    assert len(chunks) == 2
+    assert set(chunks[0]["qid"]) <= {"1", "2"}
+    assert set(chunks[1]["qid"]) <= {"3"}
+
+
+def test_retrieve_deep(api_key: str):
+    retrieve = ChatNoirRetrieve(
+        api_key=api_key,
+        num_results=25,
+        page_size=10,
+        prefetch_pages=2,
+        filter_unknown=True,
+    )
+    result = retrieve.search("python library")
+    assert len(result) <= 25
+    assert result["docno"].notna().all()
+    assert retrieve.pages_fetched["1"] >= 3
+
+
+def test_retrieve_ranks(api_key: str):
+    topics = DataFrame({
+        "qid": ["2", "1"],
+        "query": ["search engine", "python library"],
+    })
+    retrieve = ChatNoirRetrieve(
+        api_key=api_key,
+        num_results=5,
+    )
+    result = retrieve.transform(topics)
+    # Results are grouped by query, in the order of the topics.
+    assert list(result["qid"].drop_duplicates()) == ["2", "1"]
+    for _, query_result in result.groupby("qid"):
+        assert list(query_result["rank"]) == list(range(len(query_result)))
+        assert query_result["score"].is_monotonic_decreasing
+
+
+def test_retrieve_async(api_key: str):
+    topics = DataFrame({
+        "qid": ["1", "2"],
+        "query": ["python library", "search engine"],
+    })
+    retrieve = ChatNoirRetrieve(
+        api_key=api_key,
+        num_results=5,
+        features=Feature.TITLE_TEXT,
+        max_workers=2,
+    )
+    result = run(retrieve.atransform(topics))
+    assert list(result.columns) == list(retrieve.transform(topics).columns)
+    assert list(result["qid"].drop_duplicates()) == ["1", "2"]
+
+    result = run(retrieve.asearch("python library"))
+    assert 0 < len(result) <= 5
@@ -0,0 +1,59 @@
+from json import dumps as dumps_json
+from pickle import dumps, loads  # nosec: B403
+
+from chatnoir_api.v1.model import SearchResponse
+from pytest import raises
+
+from chatnoir_pyterrier import session as session_module
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.session import ChatNoirSession, default_session
+
+
+def test_session_reuses_client():
+    session = ChatNoirSession(pool_size=2)
+    client = session.client
+    assert session.client is client
+    session.close()
+    assert session.client is not client
+
+
+def test_session_new_client_after_fork(monkeypatch):
+    session = ChatNoirSession()
+    client = session.client
+    monkeypatch.setattr(session_module, "getpid", lambda: -1)
+    assert session.client is not client
+
+
+def test_session_pickle():
+    session = ChatNoirSession(base_url="http://localhost:1234/", pool_size=3)
+    session.client
+    unpickled = loads(dumps(session))  # nosec: B301
+    assert unpickled.base_url == "http://localhost:1234/"
+    assert unpickled.pool_size == 3
+    assert unpickled.client is not None
+
+
+def test_session_invalid_pool_size():
+    with raises(ValueError):
+        ChatNoirSession(pool_size=0)
+
+
+def test_default_session_shared():
+    assert default_session() is default_session()
+
+
+def test_session_decodes_like_dataclasses_json():
+    server = MockChatNoirServer(unknown_rate=0.5)
+    response = server._search_response(
+        query="python library",
+        indices=["cw12", "cw22"],
+        start=0,
+        size=20,
+        explain=False,
+        phrases=False,
+        search_method="bm25",
+    )
+    del response["results"][0]["page_rank"]
+    json = dumps_json(response)
+    assert ChatNoirSession._search_response(json, explain=False) == \
+        SearchResponse.from_json(json, infer_missing=True)
@@ -0,0 +1,57 @@
+from pathlib import Path
+from typing import List
+
+from chatnoir_pyterrier.stats import RetrievalStats, StatsHook, PrometheusStatsHook, NULL_STATS
+
+
+def test_stats_counters():
+    stats = RetrievalStats()
+    stats.count("queries")
+    stats.count("hits", 10)
+    stats.count("hits", 5)
+    assert stats.counters == {"queries": 1, "hits": 15}
+
+
+def test_stats_latency():
+    stats = RetrievalStats()
+    for seconds in range(1, 101):
+        stats.record("search", seconds / 100)
+    with stats.time("merge"):
+        pass
+    summary = stats.latency("search")
+    assert summary.count == 100
+    assert summary.max_seconds == 1.0
+    assert 0.49 <= summary.p50_seconds <= 0.51
+    assert 0.94 <= summary.p95_seconds <= 0.96
+    assert 0.98 <= summary.p99_seconds <= 1.0
+    assert set(stats.latencies.keys()) == {"search", "merge"}
+    assert stats.latency("contents").count == 0
+
+
+def test_stats_null():
+    NULL_STATS.count("queries")
+    NULL_STATS.record("search", 1.0)
+    with NULL_STATS.time("merge"):
+        pass
+    assert not NULL_STATS.enabled
+    assert NULL_STATS.counters == {}
+    assert NULL_STATS.latencies == {}
+
+
+def test_stats_hooks(tmp_path: Path):
+    stages: List[str] = []
+
+    class RecordingHook(StatsHook):
+        def finished(self, stats: RetrievalStats) -> None:
+            stages.extend(stats.latencies.keys())
+
+    path = tmp_path / "metrics.prom"
+    stats = RetrievalStats([RecordingHook(), PrometheusStatsHook(path)])
+    stats.count("queries", 3)
+    with stats.time("search"):
+        pass
+    stats.finish()
+    assert stages == ["search"]
+    metrics = path.read_text()
+    assert "chatnoir_queries_total 3\n" in metrics
+    assert 'chatnoir_stage_seconds_count{stage="search"} 1\n' in metrics
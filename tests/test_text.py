@@ -0,0 +1,71 @@
+from asyncio import run
+from uuid import NAMESPACE_URL, uuid5
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+from pytest import raises
+
+from chatnoir_pyterrier.mock import MockChatNoirServer
+from chatnoir_pyterrier.retrieve import ChatNoirRetrieve, Feature
+from chatnoir_pyterrier.text import ChatNoirText
+
+_topics = DataFrame({
+    "qid": ["1", "2"],
+    "query": ["python library", "search engine"],
+})
+
+
+def test_text_invalid_features():
+    with raises(ValueError):
+        ChatNoirText(features=Feature.TITLE)
+
+
+def test_text_after_cutoff(mock_server: MockChatNoirServer):
+    retrieve = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.UUID | Feature.INDEX,
+        num_results=30,
+    )
+    contents = mock_server.requests.get("contents", 0)
+    result = (retrieve % 5 >> ChatNoirText(retrieve)).transform(_topics)
+    # Only fetch the contents of the documents that are actually used.
+    assert mock_server.requests["contents"] == contents + 10
+
+    expected = ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        features=Feature.UUID | Feature.INDEX | Feature.CONTENTS_PLAIN,
+        num_results=5,
+    ).transform(_topics)
+    assert_frame_equal(
+        result.reset_index(drop=True)[expected.columns],
+        expected,
+        check_dtype=False,
+    )
+
+
+def test_text_from_docno(mock_server: MockChatNoirServer):
+    text = ChatNoirText(
+        ChatNoirRetrieve(api_key="test", session=mock_server.session(), index="clueweb22/b"),
+        features=Feature.CONTENTS | Feature.CONTENTS_PLAIN,
+    )
+    result = text.transform(DataFrame({"qid": ["1", "1"], "docno": ["clueweb22-en0000-00-00000", None]}))
+    uuid = uuid5(NAMESPACE_URL, "clueweb22:clueweb22-en0000-00-00000")
+    assert result["text"][0].startswith(f"Document {uuid}.")
+    assert result["contents"][0].startswith("<html>")
+    assert result["text"][1] is None
+    assert_frame_equal(run(text.atransform(result[["qid", "docno"]])), result)
+
+
+def test_text_index_from_docno(mock_server: MockChatNoirServer):
+    text = ChatNoirText(ChatNoirRetrieve(
+        api_key="test",
+        session=mock_server.session(),
+        index={"clueweb12", "clueweb22/b"},
+    ))
+    result = text.transform(DataFrame({"qid": ["1"], "docno": ["clueweb12-0000tw-00-00000"]}))
+    uuid = uuid5(NAMESPACE_URL, "clueweb12:clueweb12-0000tw-00-00000")
+    assert result["text"][0].startswith(f"Document {uuid}.")
+    with raises(RuntimeError):
+        text.transform(DataFrame({"qid": ["1"], "docno": ["msmarco_v2.1_doc_00_0"]}))